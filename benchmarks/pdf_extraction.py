@@ -0,0 +1,63 @@
+"""
+Speedup of parallel per-page PDF extraction over a single worker, by page count.
+
+Generates text-heavy PDFs of increasing length and extracts each one twice, with
+every page parsed: serially with parse_pdf_bytes, as one extraction worker does,
+and with parse_pdf_in_parallel across a process pool. The speedup is bounded by the
+number of cores; pass a worker count to override os.cpu_count().
+
+Usage: python -m benchmarks.pdf_extraction [workers]
+"""
+
+import os
+import sys
+import time
+import asyncio
+
+import main
+from benchmarks.text_normalization import WORDS, pdf_document
+
+PAGE_COUNTS = (8, 16, 32, 64, 128, 256)
+LINES_PER_PAGE = 60
+
+
+def document(pages: int) -> bytes:
+    lines = [" ".join(WORDS[(i + j) % len(WORDS)] for j in range(14)) for i in range(LINES_PER_PAGE)]
+    return pdf_document([lines] * pages)
+
+
+def best_of(runs: int, func) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(workers: int):
+    main.EXTRACTION_POOL_SIZE = workers
+    main.get_extraction_executor()
+    loop = asyncio.new_event_loop()
+    try:
+        # Start every worker process before timing anything
+        loop.run_until_complete(main.parse_pdf_in_parallel(document(workers), workers, token_budget=0))
+        print(f"{workers} workers, {main.PDF_PAGES_PER_TASK} pages per task")
+        print(f"{'pages':>6}{'serial ms':>12}{'parallel ms':>13}{'speedup':>9}")
+        for pages in PAGE_COUNTS:
+            data = document(pages)
+            serial = best_of(3, lambda: main.parse_pdf_bytes(data, token_budget=0))
+            parallel = best_of(
+                3,
+                lambda: loop.run_until_complete(
+                    main.parse_pdf_in_parallel(data, pages, token_budget=0)
+                ),
+            )
+            print(f"{pages:>6}{serial * 1000:>12.1f}{parallel * 1000:>13.1f}{serial / parallel:>8.2f}x")
+    finally:
+        loop.close()
+        main.get_extraction_executor().shutdown()
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1)
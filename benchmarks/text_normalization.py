@@ -0,0 +1,131 @@
+"""
+Measures how much normalize_text shrinks extracted resume text.
+
+Extracts every PDF, DOCX and TXT file in a corpus directory twice: raw, as before
+normalization, and through normalize_text. It prints characters and estimated prompt
+tokens for both. Without a directory it generates a synthetic corpus of PDFs laid out
+like typical resumes. Those PDFs have justified, hard-wrapped lines, hyphenation at
+line ends and bullet glyphs, so the raw text comes from pypdf itself.
+
+Usage: python -m benchmarks.text_normalization [corpus_dir]
+"""
+
+import os
+import sys
+import random
+
+import main
+
+WORDS = (
+    "led designed built migrated reduced improved automated launched scaled owned "
+    "distributed services pipeline latency throughput customers revenue platform "
+    "infrastructure reliability observability deployment kubernetes python postgres "
+    "kafka terraform react typescript analytics experimentation onboarding billing "
+    "across teams partnering with product and design to deliver measurable results "
+    "for internal and external stakeholders while mentoring engineers"
+).split()
+LINE_WIDTH = 95
+
+
+def pdf_document(pages: list) -> bytes:
+    """A minimal PDF with one Helvetica text block per page."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+    font_id = 3 + 2 * len(pages)
+    for i, lines in enumerate(pages):
+        escaped = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines)
+        ops = "BT /F1 10 Tf 54 740 Td 12 TL " + " ".join(f"({line}) Tj T*" for line in escaped) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>"
+        )
+        objects.append(f"<< /Length {len(ops)} >>\nstream\n{ops}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    out = "%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(out))
+        out += f"{i + 1} 0 obj\n{obj}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF"
+    return out.encode("latin-1")
+
+
+def wrap(words: list, rng: random.Random, prefix: str = "") -> list:
+    """Hard-wraps words like a justified PDF layout: padded spaces, hyphenated breaks."""
+    lines = []
+    line = prefix
+    for word in words:
+        if len(line) + len(word) + 1 > LINE_WIDTH:
+            if len(word) > 7 and rng.random() < 0.3:
+                cut = len(word) // 2
+                lines.append(f"{line} {word[:cut]}-")
+                line = "   " + word[cut:]
+                continue
+            lines.append(line.replace(" ", "  ", rng.randint(0, 4)))
+            line = "   " + word
+        else:
+            line = f"{line} {word}" if line.strip() else line + word
+    lines.append(line)
+    return lines
+
+
+def synthetic_resume(rng: random.Random) -> bytes:
+    lines = ["Jane Doe", "jane.doe@example.com  |  (555) 010-0100  |  github.com/janedoe", "", "Experience"]
+    for job in range(rng.randint(3, 6)):
+        lines += ["", f"Senior Engineer, Company {job}    2019 - 2023"]
+        for _ in range(rng.randint(3, 6)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(18, 40))]
+            words.insert(rng.randint(0, len(words)), f"{rng.randint(2, 90)}%")
+            lines += wrap([words[0].capitalize()] + words[1:], rng, prefix="\x95 ")
+    lines += ["", "Education", "B.S. Computer Science, State University    2015", "", "Skills"]
+    lines += wrap([rng.choice(WORDS) + "," for _ in range(30)], rng)
+    pages = [lines[i : i + 55] for i in range(0, len(lines), 55)]
+    return pdf_document(pages)
+
+
+def raw_and_normalized(name: str, data: bytes):
+    if name.endswith(".pdf"):
+        raw, _ = main.parse_pdf_bytes(data, normalize=False, token_budget=0)
+    elif name.endswith(".docx"):
+        raw = main.parse_docx_bytes(data, normalize=False)
+    else:
+        raw = data.decode("utf-8")
+    return raw, main.normalize_text(raw)
+
+
+def corpus(directory: str = None):
+    if directory:
+        for name in sorted(os.listdir(directory)):
+            if name.endswith((".pdf", ".docx", ".txt")):
+                with open(os.path.join(directory, name), "rb") as f:
+                    yield name, f.read()
+    else:
+        rng = random.Random(0)
+        for i in range(20):
+            yield f"synthetic-{i:02d}.pdf", synthetic_resume(rng)
+
+
+def run(directory: str = None):
+    print(f"{'document':<28}{'raw chars':>11}{'chars':>9}{'raw tok':>9}{'tokens':>8}{'saved':>8}")
+    totals = [0, 0, 0, 0]
+    for name, data in corpus(directory):
+        raw, normalized = raw_and_normalized(name, data)
+        counts = [
+            len(raw),
+            len(normalized),
+            main.estimate_tokens(raw),
+            main.estimate_tokens(normalized),
+        ]
+        totals = [total + count for total, count in zip(totals, counts)]
+        saved = 1 - counts[3] / counts[2]
+        print(f"{name[:27]:<28}{counts[0]:>11}{counts[1]:>9}{counts[2]:>9}{counts[3]:>8}{saved:>8.1%}")
+    saved = 1 - totals[3] / totals[2] if totals[2] else 0.0
+    print(f"{'total':<28}{totals[0]:>11}{totals[1]:>9}{totals[2]:>9}{totals[3]:>8}{saved:>8.1%}")
+
+
+if __name__ == "__main__":
+    run(sys.argv[1] if len(sys.argv) > 1 else None)
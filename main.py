@@ -1,133 +1,2392 @@
 import os
 import io
 import json
+import asyncio
+import hashlib
+import heapq
+import itertools
+import random
+import sqlite3
+import threading
+import time
+import uuid
+import zipfile
+import math
+import mmap
+import re
+import tempfile
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, contextmanager
+import multiprocessing
 
 import uvicorn
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import (
+    FastAPI,
+    UploadFile,
+    File,
+    Form,
+    Header,
+    HTTPException,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
 from dotenv import load_dotenv
 from docx import Document
 from pypdf import PdfReader
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from google.ai import generativelanguage as glm
+
+load_dotenv()
+
+# Configure Gemini API key from environment variable
+genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
+
+# Text extraction settings. "process" runs pypdf/python-docx in worker processes so
+# large documents don't block the event loop; "thread" is the fallback.
+EXTRACTION_EXECUTOR = os.environ.get("EXTRACTION_EXECUTOR", "process")
+EXTRACTION_POOL_SIZE = int(os.environ.get("EXTRACTION_POOL_SIZE", os.cpu_count() or 1))
+EXTRACTION_MAX_QUEUED = int(os.environ.get("EXTRACTION_MAX_QUEUED", "32"))
+EXTRACTION_TIMEOUT_SECONDS = float(os.environ.get("EXTRACTION_TIMEOUT_SECONDS", "30"))
+# Uploads larger than this are spooled to a temp file that extraction workers
+# memory-map, instead of being read into memory and copied to the workers
+UPLOAD_SPOOL_THRESHOLD_BYTES = int(os.environ.get("UPLOAD_SPOOL_THRESHOLD_BYTES", str(1024 * 1024)))
+# Request bodies over this size are rejected with 413 while they stream in (0 disables)
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+# Stop parsing PDF pages once this many tokens (estimated) have been extracted; pages
+# past that would be cut by the prompt budget anyway. 0 parses every page.
+PDF_EXTRACTION_TOKEN_BUDGET = int(os.environ.get("PDF_EXTRACTION_TOKEN_BUDGET", "12000"))
+# PDFs with at least this many pages are split into ranges of PDF_PAGES_PER_TASK pages
+# extracted in parallel by the process pool. 0 disables it; the thread executor never splits.
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "24"))
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", "8"))
+# Clean up extracted text (wrapped lines, hyphenation, ligatures, bullets, whitespace)
+NORMALIZE_EXTRACTED_TEXT = os.environ.get("NORMALIZE_EXTRACTED_TEXT", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Extracted-text cache, keyed by a SHA-256 of the upload. Set max bytes to 0 to disable.
+EXTRACTION_CACHE_MAX_BYTES = int(os.environ.get("EXTRACTION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+EXTRACTION_CACHE_TTL_SECONDS = float(os.environ.get("EXTRACTION_CACHE_TTL_SECONDS", "3600"))
+
+# Gemini response cache. The in-memory tier is always on (0 entries disables it);
+# the SQLite tier is only used when LLM_CACHE_SQLITE_PATH is set.
+LLM_CACHE_TTL_SECONDS = float(os.environ.get("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_SQLITE_PATH = os.environ.get("LLM_CACHE_SQLITE_PATH", "")
+LLM_CACHE_SQLITE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_SQLITE_MAX_ENTRIES", "100000"))
+
+# Keepalive pings keep the shared gRPC channel to Gemini warm between requests
+GEMINI_GRPC_KEEPALIVE_SECONDS = float(os.environ.get("GEMINI_GRPC_KEEPALIVE_SECONDS", "30"))
+
+# Admission control for upstream Gemini calls. Calls beyond LLM_MAX_CONCURRENCY wait
+# in a priority queue; once LLM_MAX_QUEUE calls are waiting, new ones get a 503.
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", "64"))
+LLM_RETRY_AFTER_SECONDS = int(os.environ.get("LLM_RETRY_AFTER_SECONDS", "2"))
+
+# Client-side pacing to stay under the Gemini project's quotas (0 disables a limit).
+# Token cost is estimated from the prompt length plus the expected output size.
+GEMINI_RPM_LIMIT = int(os.environ.get("GEMINI_RPM_LIMIT", "1000"))
+GEMINI_TPM_LIMIT = int(os.environ.get("GEMINI_TPM_LIMIT", "1000000"))
+DEFAULT_OUTPUT_TOKENS = 1024
+AUGMENT_OUTPUT_TOKENS = 256
+
+# /augment/batch packs bullet points into prompts of at most this many estimated
+# (input + output) tokens
+AUGMENT_BATCH_TOKEN_BUDGET = int(os.environ.get("AUGMENT_BATCH_TOKEN_BUDGET", "8192"))
+AUGMENT_BATCH_MAX_ITEMS = int(os.environ.get("AUGMENT_BATCH_MAX_ITEMS", "100"))
+
+# Retries of transient Gemini errors use decorrelated-jitter backoff and never run
+# past LLM_DEADLINE_SECONDS, measured from when the call is first attempted.
+LLM_MAX_ATTEMPTS = int(os.environ.get("LLM_MAX_ATTEMPTS", "4"))
+LLM_RETRY_BASE_SECONDS = float(os.environ.get("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.environ.get("LLM_RETRY_MAX_SECONDS", "8"))
+LLM_DEADLINE_SECONDS = float(os.environ.get("LLM_DEADLINE_SECONDS", "60"))
+
+# Optional request hedging: if an upstream call is slower than the given percentile of
+# recent latencies, an identical backup request is sent and the first answer wins.
+# LLM_HEDGE_MAX_RATIO caps hedges as a fraction of all calls.
+LLM_HEDGE_ENABLED = os.environ.get("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MAX_RATIO = float(os.environ.get("LLM_HEDGE_MAX_RATIO", "0.05"))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# Asynchronous grading jobs: worker count, how many jobs may wait, and how long
+# finished results stay retrievable
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_MAX_QUEUED = int(os.environ.get("JOB_MAX_QUEUED", "1000"))
+JOB_RESULT_TTL_SECONDS = float(os.environ.get("JOB_RESULT_TTL_SECONDS", "3600"))
+
+# Lower values are admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_STANDARD = 1
+PRIORITY_BULK = 2
+
+# Recruiter ranking: many resumes against one job description. Resumes are pre-ranked
+# locally and only the top RANKING_TOP_K are compared by Gemini.
+RANKING_MAX_RESUMES = int(os.environ.get("RANKING_MAX_RESUMES", "500"))
+RANKING_TOP_K = int(os.environ.get("RANKING_TOP_K", "20"))
+RANKING_MAX_FILE_BYTES = int(os.environ.get("RANKING_MAX_FILE_BYTES", str(20 * 1024 * 1024)))
+RANKING_MAX_TOTAL_BYTES = int(os.environ.get("RANKING_MAX_TOTAL_BYTES", str(200 * 1024 * 1024)))
+
+# One resume against many job descriptions in /comparison/bulk
+BULK_COMPARISON_MAX_JOBS = int(os.environ.get("BULK_COMPARISON_MAX_JOBS", "50"))
+BULK_COMPARISON_CONCURRENCY = int(os.environ.get("BULK_COMPARISON_CONCURRENCY", "8"))
+
+DEFAULT_MODEL_NAME = "gemini-2.5-flash"
+GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+_extraction_executor = None
+# Executor jobs not yet finished; decremented from executor threads, hence the lock
+_extraction_jobs = 0
+_extraction_jobs_lock = threading.Lock()
+
+
+def get_extraction_executor():
+    """Returns the shared extraction executor, creating it on first use."""
+    global _extraction_executor
+    if _extraction_executor is None:
+        if EXTRACTION_EXECUTOR == "process":
+            try:
+                # Workers must not be forked from a process that already runs gRPC threads
+                start_method = (
+                    "forkserver"
+                    if "forkserver" in multiprocessing.get_all_start_methods()
+                    else "spawn"
+                )
+                _extraction_executor = ProcessPoolExecutor(
+                    max_workers=EXTRACTION_POOL_SIZE,
+                    mp_context=multiprocessing.get_context(start_method),
+                )
+            except (NotImplementedError, OSError, ImportError):
+                # Some platforms (e.g. without working semaphores) can't host a process pool
+                _extraction_executor = None
+        if _extraction_executor is None:
+            _extraction_executor = ThreadPoolExecutor(
+                max_workers=EXTRACTION_POOL_SIZE, thread_name_prefix="extract"
+            )
+    return _extraction_executor
+
+
+def discard_extraction_executor(executor):
+    """Drops a broken executor so the next extraction builds a fresh pool."""
+    global _extraction_executor
+    if _extraction_executor is executor:
+        _extraction_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if os.environ.get("GOOGLE_API_KEY"):
+        gemini_models.get(DEFAULT_MODEL_NAME, GENERATION_CONFIG)
+    yield
+    await job_runner.stop()
+    await gemini_models.close()
+    if _extraction_executor is not None:
+        _extraction_executor.shutdown(wait=False, cancel_futures=True)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects request bodies over `max_bytes` with 413 while they are received: up
+    front from Content-Length, otherwise as soon as the streamed body exceeds it.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.max_bytes:
+            await self.app(scope, receive, send)
+            return
+        detail = f"Upload exceeds the maximum size of {self.max_bytes} bytes."
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = JSONResponse(status_code=413, content={"detail": detail})
+            await response(scope, receive, send)
+            return
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            received += len(message.get("body", b""))
+            if received > self.max_bytes:
+                # Raised while the endpoint parses the body, so FastAPI turns it into the response
+                raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # Adjust this to your frontend domain in production
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+TEXT_REPLACEMENTS = str.maketrans(
+    {
+        "ﬀ": "ff",
+        "ﬁ": "fi",
+        "ﬂ": "fl",
+        "ﬃ": "ffi",
+        "ﬄ": "ffl",
+        "ﬅ": "ft",
+        "ﬆ": "st",
+        "\t": " ",
+        "\u00a0": " ",
+        "\u2009": " ",
+        "\u202f": " ",
+        "\u00ad": None,
+        "\u200b": None,
+        "\ufeff": None,
+        "\r": None,
+    }
+)
+# Bullet glyphs, including the private-use codepoints Symbol/Wingdings bullets extract as
+BULLET_GLYPHS = re.compile(
+    "^[ ]*[•●▪◦‣∙■□◆◇➢►▶✓✔❖➤\uf0a7\uf0b7\uf076\uf0d8\uf0fc][ ]*", re.MULTILINE
+)
+# A word broken across lines after a hyphen. The hyphen is dropped when the joined word
+# is known or the second part is only a suffix ("Kuber-\nnetes", "deploy-\nment"), and
+# kept otherwise, since a real compound ("end-to-\nend", "e-\ncommerce") looks the same
+HYPHENATED_BREAK = re.compile(r"([A-Za-z]*[a-z])-[ ]*\n[ ]*([a-z][A-Za-z]*)")
+WORD_SUFFIXES = frozenset(
+    "able ably al ally ance ances ant ed ence ences ent er ers ful ible ibly ing ings ion "
+    "ions ism ist ists ity ities ive ize ized izes ization izations less ly ment ments ness "
+    "ous ship ships sion sions tion tions ure ures".split()
+)
+# Lines starting with these are list items and are never joined onto the previous line
+LIST_MARKERS = ("•", "*", "-", "–", "—", "·")
+REPEATED_SPACES = re.compile(r" {2,}")
+WRAPPED_LINE_MIN = 40
+# Short lines among the first or last PAGE_EDGE_LINES of at least REPEATED_LINE_MIN pages
+# are running headers/footers
+PAGE_EDGE_LINES = 2
+REPEATED_LINE_MIN = 3
+
+
+def normalize_text(text: str) -> str:
+    """
+    Cleans up extracted text before it is cached and sent to the LLM: normalizes
+    ligatures, odd spaces and bullet glyphs ("• "), rejoins hyphenated (see
+    rejoin_hyphenated_breaks) and wrapped lines, collapses runs of spaces and keeps
+    at most one blank line in a row. List items are never joined onto the previous
+    line.
+    """
+    text = text.translate(TEXT_REPLACEMENTS)
+    text = BULLET_GLYPHS.sub("• ", text)
+    text = rejoin_hyphenated_breaks(text)
+    lines = []
+    for line in REPEATED_SPACES.sub(" ", text).split("\n"):
+        line = line.strip()
+        previous = lines[-1] if lines else ""
+        if line and previous and not line.startswith(LIST_MARKERS) and (
+            (line[0].islower() and len(previous) >= WRAPPED_LINE_MIN) or previous[-1] == ","
+        ):
+            # A line broken by the page width rather than by the author (short lines
+            # such as headings are never continued)
+            lines[-1] = f"{previous} {line}"
+        elif line or previous:
+            lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def rejoin_hyphenated_breaks(text: str) -> str:
+    """
+    Joins words broken across lines after a hyphen (see HYPHENATED_BREAK). Known
+    words are the skill vocabulary's and those written unbroken elsewhere in `text`.
+    """
+    known = skill_vocabulary.words | set(re.findall(r"[a-z]+", text.lower()))
+
+    def join(match) -> str:
+        left, right = match.groups()
+        joined = left + right
+        # A single letter is a prefix of a real compound (e-commerce, x-ray)
+        if len(left) > 1 and (joined.lower() in known or right.lower() in WORD_SUFFIXES):
+            return joined
+        return f"{left}-{right}"
+
+    return HYPHENATED_BREAK.sub(join, text)
+
+
+def strip_page_headers(pages: list) -> list:
+    """
+    Removes running headers and footers from PDF page texts: short lines repeated at
+    the top or bottom of several pages, keeping their first occurrence. Lines in the
+    body of a page are never removed.
+    """
+
+    def edges(lines: list) -> set:
+        filled = [index for index, line in enumerate(lines) if line.strip()]
+        return set(filled[:PAGE_EDGE_LINES] + filled[-PAGE_EDGE_LINES:])
+
+    pages = [page.split("\n") for page in pages]
+    counts = Counter(
+        key
+        for lines in pages
+        for key in {lines[index].strip() for index in edges(lines)}
+        if len(key) <= 80
+    )
+    repeated = {key for key, count in counts.items() if count >= REPEATED_LINE_MIN}
+    seen = set()
+    stripped = []
+    for lines in pages:
+        dropped = set()
+        for index in sorted(edges(lines)):
+            key = lines[index].strip()
+            if key in repeated:
+                if key in seen:
+                    dropped.add(index)
+                seen.add(key)
+        stripped.append("\n".join(line for index, line in enumerate(lines) if index not in dropped))
+    return stripped
+
+
+def join_pdf_pages(pages: list, normalize: bool) -> str:
+    """Joins extracted page texts; with `normalize`, strips page headers and normalizes the text."""
+    if not normalize:
+        return "\n".join(pages)
+    return normalize_text("\n".join(strip_page_headers(pages)))
+
+
+def iter_pdf_pages(reader: PdfReader):
+    """Yields the text of each page of a PDF, parsing pages lazily."""
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def iter_docx_paragraphs(document):
+    """Yields the text of each paragraph of a DOCX document."""
+    for paragraph in document.paragraphs:
+        yield paragraph.text
+
+
+class MappedFile(mmap.mmap):
+    """A read-only memory map usable as a file by zipfile (python-docx), which needs `seekable`."""
+
+    def seekable(self) -> bool:
+        return True
+
+
+@contextmanager
+def open_document(source):
+    """
+    Opens a document source as a seekable binary stream. The source is the upload's
+    bytes or the path of a spooled upload (memory-mapped, so worker processes share
+    the page cache instead of holding copies).
+    """
+    if isinstance(source, bytes):
+        yield io.BytesIO(source)
+    else:
+        with open(source, "rb") as f, MappedFile(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+def parse_pdf_bytes(
+    source,
+    normalize: bool = NORMALIZE_EXTRACTED_TEXT,
+    token_budget: int = PDF_EXTRACTION_TOKEN_BUDGET,
+    split_from_pages: int = 0,
+):
+    """
+    Extracts text from a PDF (see open_document for the sources). Runs inside the
+    extraction executor. Pages after the one that reaches `token_budget` aren't parsed. Returns the text
+    and the number of pages skipped. PDFs with at least `split_from_pages` pages
+    (0 = never) aren't parsed at all: (None, page count) is returned so the caller
+    can split them across workers.
+    """
+    with open_document(source) as stream:
+        reader = PdfReader(stream)
+        if split_from_pages and len(reader.pages) >= split_from_pages:
+            return None, len(reader.pages)
+        pages = []
+        size = 0
+        for page_text in iter_pdf_pages(reader):
+            pages.append(page_text)
+            size += len(page_text)
+            if token_budget and size // 4 >= token_budget:  # estimate_tokens, four characters each
+                break
+        pages_skipped = len(reader.pages) - len(pages)
+    return join_pdf_pages(pages, normalize), pages_skipped
+
+
+def parse_pdf_page_range(source, start: int, stop: int) -> list:
+    """
+    Extracts the text of pages [start, stop) of a PDF (see open_document for the
+    sources). Runs inside the extraction executor.
+    """
+    with open_document(source) as stream:
+        reader = PdfReader(stream)
+        return [reader.pages[index].extract_text() or "" for index in range(start, stop)]
+
+
+def parse_docx_bytes(source, normalize: bool = NORMALIZE_EXTRACTED_TEXT) -> str:
+    """
+    Extracts text from a DOCX document (see open_document for the sources). Runs
+    inside the extraction executor.
+    """
+    with open_document(source) as stream:
+        text = "\n".join(iter_docx_paragraphs(Document(stream)))
+    return normalize_text(text) if normalize else text
+
+
+class ExtractionCache:
+    """
+    LRU cache of extracted text bounded by the total UTF-8 size of the stored text.
+    Entries expire after `ttl_seconds`. `get` returns `(text, info)`, where info is a
+    small dict of extraction metadata, or None.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, size, text, info)
+        self._size = 0
+
+    @staticmethod
+    def key_for(kind: str, digest: str) -> str:
+        return f"{kind}:{digest}"
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._evict(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2], entry[3]
+
+    def put(self, key: str, text: str, info: dict = None):
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._evict(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, size, text, info or {})
+        self._size += size
+        while self._size > self.max_bytes:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, key: str):
+        self._size -= self._entries.pop(key)[1]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+extraction_cache = ExtractionCache(EXTRACTION_CACHE_MAX_BYTES, EXTRACTION_CACHE_TTL_SECONDS)
+
+
+def submit_extraction(parser, *args):
+    """
+    Submits `parser(*args)` to the extraction executor and returns an awaitable for
+    its result. The job counts against the extraction queue limit until it actually
+    finishes, even after its caller has timed out and stopped waiting.
+    """
+    global _extraction_jobs
+    future = get_extraction_executor().submit(parser, *args)
+    with _extraction_jobs_lock:
+        _extraction_jobs += 1
+    future.add_done_callback(finish_extraction)
+    return asyncio.wrap_future(future)
+
+
+def finish_extraction(future):
+    global _extraction_jobs
+    with _extraction_jobs_lock:
+        _extraction_jobs -= 1
+
+
+async def run_extraction(parser, *args):
+    """
+    Runs a parser on the extraction executor and awaits the result.
+    Rejects with 503 when too many jobs are queued and 504 when a job exceeds its timeout.
+    """
+    return await run_bounded_extraction(lambda: submit_extraction(parser, *args))
+
+
+async def run_bounded_extraction(start_work):
+    """
+    Awaits the extraction started by `start_work()` under the extraction queue limit
+    (503 when full) and EXTRACTION_TIMEOUT_SECONDS (504). When a pool worker has died
+    (e.g. killed for running out of memory) the pool is replaced and the work retried
+    once, then 503.
+    """
+    if _extraction_jobs >= EXTRACTION_POOL_SIZE + EXTRACTION_MAX_QUEUED:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many documents are being processed. Please retry shortly.",
+            headers={"Retry-After": "1"},
+        )
+    for _ in range(2):
+        executor = get_extraction_executor()
+        try:
+            return await asyncio.wait_for(start_work(), timeout=EXTRACTION_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Timed out extracting text from document.")
+        except BrokenProcessPool:
+            discard_extraction_executor(executor)
+    raise HTTPException(
+        status_code=503,
+        detail="Document extraction workers were restarted. Please retry shortly.",
+        headers={"Retry-After": "1"},
+    )
+
+
+def write_spool_file(data: bytes) -> str:
+    """Writes `data` to a new temp file and returns its path; the caller unlinks it."""
+    with tempfile.NamedTemporaryFile(prefix="upload-", delete=False) as spool:
+        spool.write(data)
+    return spool.name
+
+
+async def parse_pdf_in_parallel(
+    source,
+    page_count: int,
+    normalize: bool = NORMALIZE_EXTRACTED_TEXT,
+    token_budget: int = PDF_EXTRACTION_TOKEN_BUDGET,
+):
+    """
+    Extracts a large PDF in ranges of PDF_PAGES_PER_TASK pages across the process
+    pool. In-memory uploads are spooled to a temp file first, so every worker
+    memory-maps the same file instead of receiving the bytes with each task. At most
+    one range per worker is in flight, and ranges are consumed in order. With a
+    token budget, only the first range is parsed at first. Further ranges are
+    submitted only as far as the pages parsed so far suggest the budget needs.
+    Returns the text and the number of pages skipped, like parse_pdf_bytes.
+    """
+    ranges = [
+        (start, min(start + PDF_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PDF_PAGES_PER_TASK)
+    ]
+    path = source
+    if isinstance(source, bytes):
+        path = await asyncio.to_thread(write_spool_file, source)
+    in_flight = deque()
+    submitted = 0
+    pages = []
+    size = 0
+    budget_met = False
+    try:
+        while (submitted < len(ranges) or in_flight) and not budget_met:
+            allowed = len(ranges)
+            if token_budget and not pages:
+                # The first range alone, to see how much text a page holds
+                allowed = 1
+            elif token_budget:
+                # Enough ranges for the pages still needed at the density seen so far
+                per_page = max(size / len(pages), 1)
+                needed = len(pages) + math.ceil((token_budget * 4 - size) / per_page)
+                allowed = math.ceil(needed / PDF_PAGES_PER_TASK)
+            while submitted < min(allowed, len(ranges)) and len(in_flight) < EXTRACTION_POOL_SIZE:
+                start, stop = ranges[submitted]
+                in_flight.append(submit_extraction(parse_pdf_page_range, path, start, stop))
+                submitted += 1
+            for page_text in await in_flight.popleft():
+                pages.append(page_text)
+                size += len(page_text)
+                if token_budget and size // 4 >= token_budget:
+                    budget_met = True
+                    break
+    finally:
+        for future in in_flight:
+            future.cancel()
+        if path is not source:
+            # Workers still reading have the file mapped, which keeps it alive
+            os.unlink(path)
+    text = await submit_extraction(join_pdf_pages, pages, normalize)
+    return text, page_count - len(pages)
+
+
+class UploadSource:
+    """
+    An upload prepared for extraction, used as a context manager. Uploads up to
+    UPLOAD_SPOOL_THRESHOLD_BYTES are read into `source` as bytes. Larger ones are
+    copied in chunks to a temp file whose path becomes `source`, so they are never
+    held in memory. `digest` is the SHA-256 of the content. Building one reads and
+    hashes the whole upload, so callers on the event loop use asyncio.to_thread.
+    """
+
+    CHUNK_BYTES = 1024 * 1024
+
+    def __init__(self, file: UploadFile):
+        self.path = None
+        file.file.seek(0, os.SEEK_END)
+        size = file.file.tell()
+        file.file.seek(0)
+        if size <= UPLOAD_SPOOL_THRESHOLD_BYTES:
+            self.source = file.file.read()
+            self.digest = hashlib.sha256(self.source).hexdigest()
+            return
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(prefix="upload-", delete=False) as spool:
+            self.path = spool.name
+            for chunk in iter(lambda: file.file.read(self.CHUNK_BYTES), b""):
+                digest.update(chunk)
+                spool.write(chunk)
+        self.source = self.path
+        self.digest = digest.hexdigest()
+
+    def read(self) -> bytes:
+        if self.path is None:
+            return self.source
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.path is not None:
+            # Workers still reading have the file open or mapped, which keeps it alive
+            os.unlink(self.path)
+
+
+async def extract_text_from_pdf(file: UploadFile):
+    """
+    Extracts text from a PDF file. Returns the text and extraction metadata
+    ("PagesSkipped" when parsing stopped at PDF_EXTRACTION_TOKEN_BUDGET).
+    """
+    with await asyncio.to_thread(UploadSource, file) as upload:
+        key = ExtractionCache.key_for("pdf", upload.digest)
+        cached = extraction_cache.get(key)
+        if cached is not None:
+            return cached
+        executor = get_extraction_executor()
+        split_from_pages = PDF_PARALLEL_MIN_PAGES if isinstance(executor, ProcessPoolExecutor) else 0
+        try:
+            text, pages_skipped = await run_extraction(
+                parse_pdf_bytes,
+                upload.source,
+                NORMALIZE_EXTRACTED_TEXT,
+                PDF_EXTRACTION_TOKEN_BUDGET,
+                split_from_pages,
+            )
+            if text is None:
+                text, pages_skipped = await run_bounded_extraction(
+                    lambda: parse_pdf_in_parallel(upload.source, pages_skipped)
+                )
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Error processing PDF: {e}")
+    info = {"PagesSkipped": pages_skipped} if pages_skipped else {}
+    extraction_cache.put(key, text, info)
+    return text, info
+
+
+async def extract_text_from_docx(file: UploadFile):
+    """Extracts text from a DOCX file. Returns the text and extraction metadata."""
+    with await asyncio.to_thread(UploadSource, file) as upload:
+        key = ExtractionCache.key_for("docx", upload.digest)
+        cached = extraction_cache.get(key)
+        if cached is not None:
+            return cached
+        try:
+            text = await run_extraction(parse_docx_bytes, upload.source)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Error processing DOCX: {e}")
+    extraction_cache.put(key, text)
+    return text, {}
+
+
+async def extract_text_from_text_file(file: UploadFile):
+    """Extracts text from a plain text file. Returns the text and extraction metadata."""
+    with await asyncio.to_thread(UploadSource, file) as upload:
+        key = ExtractionCache.key_for("txt", upload.digest)
+        cached = extraction_cache.get(key)
+        if cached is not None:
+            return cached
+        try:
+            text = (await asyncio.to_thread(upload.read)).decode("utf-8")
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Error processing text file: {e}")
+    if NORMALIZE_EXTRACTED_TEXT:
+        text = normalize_text(text)
+    extraction_cache.put(key, text)
+    return text, {}
+
+
+class MemoryResponseCache:
+    """
+    In-memory LRU of LLM responses, bounded by entry count.
+    Like every response cache tier, `get` returns `(text, expires_at)` or None.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, text)
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1], entry[0]
+
+    async def set(self, key: str, text: str, expires_at: float = None):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (expires_at or time.time() + self.ttl_seconds, text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class SqliteResponseCache:
+    """
+    On-disk LLM response cache backed by SQLite, shared across workers and restarts.
+    Expired rows and rows over `max_entries` are evicted every EVICT_EVERY writes, so
+    the table can briefly hold up to EVICT_EVERY - 1 rows over the cap.
+    """
+
+    EVICT_EVERY = 100
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, text TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)"
+        )
+        self._conn.commit()
+
+    def _get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, expires_at FROM responses WHERE key = ? AND expires_at >= ?",
+                (key, time.time()),
+            ).fetchone()
+        return row
+
+    def _set(self, key: str, text: str, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, text, expires_at) VALUES (?, ?, ?)",
+                (key, text, expires_at),
+            )
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict()
+            self._writes += 1
+            self._conn.commit()
+
+    def _evict(self):
+        """Drops expired rows, then the soonest-to-expire ones beyond the size cap."""
+        self._conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                "ORDER BY expires_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    async def get(self, key: str):
+        row = await asyncio.to_thread(self._get, key)
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row
+
+    async def set(self, key: str, text: str, expires_at: float = None):
+        await asyncio.to_thread(
+            self._set, key, text, expires_at or time.time() + self.ttl_seconds
+        )
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class TieredResponseCache:
+    """Looks up each tier in order and back-fills faster tiers on a hit."""
+
+    def __init__(self, tiers: list):
+        self.tiers = tiers
+
+    async def get(self, key: str):
+        for index, tier in enumerate(self.tiers):
+            value = await tier.get(key)
+            if value is None:
+                continue
+            text, expires_at = value
+            for faster_tier in self.tiers[:index]:
+                await faster_tier.set(key, text, expires_at)
+            return text
+        return None
+
+    async def set(self, key: str, text: str):
+        for tier in self.tiers:
+            await tier.set(key, text)
+
+    def stats(self) -> dict:
+        return {type(tier).__name__: tier.stats() for tier in self.tiers}
+
+
+def build_response_cache() -> TieredResponseCache:
+    tiers = [MemoryResponseCache(LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS)]
+    if LLM_CACHE_SQLITE_PATH:
+        tiers.append(
+            SqliteResponseCache(
+                LLM_CACHE_SQLITE_PATH, LLM_CACHE_SQLITE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS
+            )
+        )
+    return TieredResponseCache(tiers)
+
+
+response_cache = build_response_cache()
+
+
+def llm_cache_key(prompt: str, model_name: str, generation_config: dict) -> str:
+    """Hashes the model, generation config and whitespace-normalized prompt."""
+    normalized = json.dumps(
+        {
+            "model": model_name,
+            "config": generation_config,
+            "prompt": " ".join(prompt.split()),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def create_gemini_channel(host, options=(), **kwargs):
+    """Creates the gRPC channel to Gemini with keepalive settings applied."""
+    keepalive_ms = int(GEMINI_GRPC_KEEPALIVE_SECONDS * 1000)
+    options = list(options) + [
+        ("grpc.keepalive_time_ms", keepalive_ms),
+        ("grpc.keepalive_timeout_ms", 10000),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+    ]
+    transport_class = glm.GenerativeServiceAsyncClient.get_transport_class("grpc_asyncio")
+    return transport_class.create_channel(host, options=options, **kwargs)
+
+
+def create_gemini_client():
+    """Creates the async Gemini client whose channel is shared by every model."""
+    transport_class = glm.GenerativeServiceAsyncClient.get_transport_class("grpc_asyncio")
+    return glm.GenerativeServiceAsyncClient(
+        client_options={"api_key": os.environ.get("GOOGLE_API_KEY")},
+        transport=lambda **kwargs: transport_class(channel=create_gemini_channel, **kwargs),
+    )
+
+
+class ModelRegistry:
+    """
+    Builds each GenerativeModel (with its GenerationConfig baked in) once and reuses
+    it, on one async client whose channel has keepalive settings. The per-call
+    saving over building models on genai's default client is small (about 0.1 ms;
+    see benchmarks/gemini_models.py). What the registry is for is the keepalive
+    channel.
+    """
+
+    def __init__(self, client_factory=create_gemini_client):
+        self.client_factory = client_factory
+        self._client = None
+        self._models = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self.client_factory()
+        return self._client
+
+    def get(self, model_name: str, generation_config: dict):
+        key = (model_name, json.dumps(generation_config, sort_keys=True))
+        model = self._models.get(key)
+        if model is None:
+            model = genai.GenerativeModel(
+                model_name,
+                generation_config=genai.types.GenerationConfig(**generation_config),
+            )
+            # genai.configure only accepts a transport name, so this private attribute
+            # is the only way to put models on the keepalive channel. Re-check it when
+            # upgrading google-generativeai.
+            model._async_client = self.client
+            self._models[key] = model
+        return model
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.transport.close()
+            self._client = None
+        self._models.clear()
+
+
+gemini_models = ModelRegistry()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for Gemini models (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """Bucket holding up to `per_minute` units, refilled continuously."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units (capped at capacity) are available."""
+        self._refill()
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+
+class QuotaRateLimiter:
+    """
+    Paces calls against a requests-per-minute and a tokens-per-minute bucket.
+    Callers wait in FIFO order until both buckets can cover their cost.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.paced_calls = 0
+        self.paced_seconds = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int):
+        costs = [
+            (bucket, amount)
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens))
+            if bucket
+        ]
+        async with self._lock:
+            delay = max((bucket.wait_time(amount) for bucket, amount in costs), default=0.0)
+            if delay > 0:
+                self.paced_calls += 1
+            while delay > 0:
+                self.paced_seconds += delay
+                await asyncio.sleep(delay)
+                delay = max(bucket.wait_time(amount) for bucket, amount in costs)
+            for bucket, amount in costs:
+                bucket.take(amount)
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        """Corrects the token bucket once the real usage of a call is known."""
+        if self.tokens:
+            self.tokens.take(actual_tokens - estimated_tokens)
+
+    def stats(self) -> dict:
+        stats = {"paced_calls": self.paced_calls, "paced_seconds": round(self.paced_seconds, 3)}
+        for name, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            if bucket:
+                bucket.wait_time(0)
+                stats[name] = {"available": int(bucket.level), "capacity": bucket.capacity}
+        return stats
+
+
+gemini_quota = QuotaRateLimiter(GEMINI_RPM_LIMIT, GEMINI_TPM_LIMIT)
+
+
+async def request_gemini(
+    prompt: str,
+    model_name: str,
+    output_tokens: int = DEFAULT_OUTPUT_TOKENS,
+    deadline: float = None,
+) -> str:
+    """
+    Sends a single prompt to Gemini and returns the raw response text.
+    Waits for quota first; `output_tokens` is the expected response size and
+    `deadline` (a time.monotonic() value) bounds the upstream call.
+    """
+    estimated_tokens = estimate_tokens(prompt) + output_tokens
+    await gemini_quota.acquire(estimated_tokens)
+    # RetryPolicy is the only retry layer; the client's default retry would nest
+    # inside it and ignore the deadline
+    request_options = {"retry": None}
+    if deadline is not None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        request_options["timeout"] = remaining
+    model = gemini_models.get(model_name, GENERATION_CONFIG)
+    response = await model.generate_content_async(
+        contents=[prompt], request_options=request_options
+    )
+    usage = getattr(response, "usage_metadata", None)
+    if usage and usage.total_token_count:
+        gemini_quota.settle(estimated_tokens, usage.total_token_count)
+    return response.text
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one shared upstream task.
+    Every waiter sees the same result or exception. A waiter that is cancelled
+    (e.g. its client disconnected) leaves the shared task running for the others;
+    the task is only cancelled once no waiters remain.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls = {}  # key -> {"task": asyncio.Task, "waiters": int}
+
+    async def do(self, key: str, func):
+        call = self._calls.get(key)
+        if call is None:
+            call = {"task": asyncio.ensure_future(func()), "waiters": 0}
+            self._calls[key] = call
+            call["task"].add_done_callback(lambda _: self._forget(key, call))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        call["waiters"] += 1
+        try:
+            return await asyncio.shield(call["task"])
+        finally:
+            call["waiters"] -= 1
+            if call["waiters"] == 0 and not call["task"].done():
+                call["task"].cancel()
+                self._forget(key, call)
+
+    def _forget(self, key: str, call: dict):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
+
+
+gemini_flights = SingleFlight()
+
+
+class AdmissionController:
+    """
+    Limits concurrent upstream calls. Callers that can't start immediately wait in a
+    bounded priority queue (lowest priority value first, FIFO within a priority);
+    when the queue is full they are rejected with 503 and a Retry-After header.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, retry_after_seconds: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.retry_after_seconds = retry_after_seconds
+        self.admitted = 0
+        self.rejected = 0
+        self._active = 0
+        self._waiters = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+
+    async def acquire(self, priority: int = PRIORITY_STANDARD):
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="The grading service is busy. Please retry shortly.",
+                headers={"Retry-After": str(self.retry_after_seconds)},
+            )
+        entry = (priority, next(self._sequence), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, entry)
+        try:
+            await entry[2]
+        except asyncio.CancelledError:
+            if entry[2].done() and not entry[2].cancelled():
+                # The slot was handed over just as we were cancelled; pass it on
+                self.release()
+            elif entry in self._waiters:
+                # release() may already have popped (and skipped) the cancelled entry
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+        self.admitted += 1
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot straight to the next waiter
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_STANDARD):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+llm_admission = AdmissionController(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_RETRY_AFTER_SECONDS)
+
+
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.Aborted,
+    asyncio.TimeoutError,
+)
+
+
+class RetryPolicy:
+    """
+    Retries transient errors with decorrelated-jitter backoff
+    (sleep = min(cap, uniform(base, previous_sleep * 3))). A retry is only made if
+    its backoff ends before the deadline; otherwise the last error is raised.
+    """
+
+    def __init__(self, max_attempts: int, base_seconds: float, max_seconds: float):
+        self.max_attempts = max_attempts
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.calls = 0
+        self.retries = 0
+        self.exhausted = 0
+        self.attempts = {}  # attempts needed -> number of calls
+
+    async def run(self, func, deadline: float):
+        """Awaits `func()` until it succeeds, fails permanently or runs out of time."""
+        self.calls += 1
+        sleep = self.base_seconds
+        attempt = 1
+        while True:
+            try:
+                result = await func()
+            except RETRYABLE_ERRORS:
+                sleep = min(self.max_seconds, random.uniform(self.base_seconds, sleep * 3))
+                if attempt >= self.max_attempts or time.monotonic() + sleep >= deadline:
+                    self.exhausted += 1
+                    self._record(attempt)
+                    raise
+                self.retries += 1
+                attempt += 1
+                await asyncio.sleep(sleep)
+                continue
+            except Exception:
+                self._record(attempt)
+                raise
+            self._record(attempt)
+            return result
+
+    def _record(self, attempt: int):
+        self.attempts[attempt] = self.attempts.get(attempt, 0) + 1
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "exhausted": self.exhausted,
+            "attempts": dict(sorted(self.attempts.items())),
+        }
+
+
+gemini_retries = RetryPolicy(LLM_MAX_ATTEMPTS, LLM_RETRY_BASE_SECONDS, LLM_RETRY_MAX_SECONDS)
+
+
+class Hedger:
+    """
+    Sends a backup copy of a slow call once it has run longer than the configured
+    percentile of recent latencies, returns whichever copy succeeds first and
+    cancels the other. Hedging starts after `min_samples` latencies have been seen
+    and is skipped whenever hedges already exceed `max_ratio` of all calls.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        percentile: float,
+        max_ratio: float,
+        min_samples: int,
+        window: int = 500,
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._latencies = deque(maxlen=window)
+
+    def delay(self):
+        """Returns the current hedge delay in seconds, or None while warming up."""
+        if len(self._latencies) < self.min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return ordered[index]
+
+    async def run(self, func):
+        self.calls += 1
+        start = time.monotonic()
+        tasks = [asyncio.ensure_future(func())]
+        try:
+            delay = self.delay() if self.enabled else None
+            if delay is not None and self.hedges < self.max_ratio * self.calls:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    self.hedges += 1
+                    tasks.append(asyncio.ensure_future(func()))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        if task is not tasks[0]:
+                            self.hedge_wins += 1
+                        self._latencies.append(time.monotonic() - start)
+                        return task.result()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # mark as retrieved
+
+    def stats(self) -> dict:
+        delay = self.delay()
+        return {
+            "enabled": self.enabled,
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "delay_seconds": round(delay, 3) if delay is not None else None,
+        }
+
+
+gemini_hedger = Hedger(
+    LLM_HEDGE_ENABLED, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MAX_RATIO, LLM_HEDGE_MIN_SAMPLES
+)
+
+
+def gemini_error_to_http(e: Exception) -> HTTPException:
+    """Maps an error from a Gemini call to the HTTP error returned to the client."""
+    if isinstance(e, (asyncio.TimeoutError, google_exceptions.DeadlineExceeded)):
+        return HTTPException(status_code=504, detail="Timed out waiting for Gemini LLM.")
+    if isinstance(e, RETRYABLE_ERRORS):
+        return HTTPException(
+            status_code=503,
+            detail=f"Gemini LLM is temporarily unavailable: {e}",
+            headers={"Retry-After": str(LLM_RETRY_AFTER_SECONDS)},
+        )
+    return HTTPException(status_code=500, detail=f"Error communicating with Gemini LLM: {e}")
+
+
+async def fetch_gemini_response(
+    prompt: str,
+    model_name: str,
+    key: str,
+    priority: int = PRIORITY_STANDARD,
+    output_tokens: int = DEFAULT_OUTPUT_TOKENS,
+) -> str:
+    """
+    Calls Gemini once admitted, retrying transient errors, and stores well-formed
+    responses in the response cache.
+    """
+    deadline = time.monotonic() + LLM_DEADLINE_SECONDS
+    try:
+        async with llm_admission.slot(priority):
+            text = await gemini_retries.run(
+                lambda: gemini_hedger.run(
+                    lambda: request_gemini(prompt, model_name, output_tokens, deadline)
+                ),
+                deadline,
+            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise gemini_error_to_http(e)
+    # Only cache well-formed JSON so a bad generation isn't replayed
+    try:
+        json.loads(text)
+    except ValueError:
+        return text
+    await response_cache.set(key, text)
+    return text
+
+
+async def call_gemini_llm(
+    prompt: str,
+    model_name: str = DEFAULT_MODEL_NAME,
+    use_cache: bool = True,
+    priority: int = PRIORITY_STANDARD,
+    output_tokens: int = DEFAULT_OUTPUT_TOKENS,
+):
+    """
+    Makes a service call to the Gemini LLM and returns the generated text.
+    Assumes the LLM will return a JSON string.
+    Responses are served from the response cache when possible; `use_cache=False`
+    skips the lookup but still stores the fresh response. Identical prompts that
+    are already in flight share a single upstream call. Upstream calls are admitted
+    by `priority` (see AdmissionController) and paced against the Gemini quotas
+    using `output_tokens` as the expected response size.
+    """
+    key = llm_cache_key(prompt, model_name, GENERATION_CONFIG)
+    if use_cache:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            return cached
+    # Return the JSON string to be parsed by FastAPI's JSONResponse
+    return await gemini_flights.do(
+        key,
+        lambda: fetch_gemini_response(prompt, model_name, key, priority, output_tokens),
+    )
+
+
+async def stream_gemini(
+    prompt: str,
+    model_name: str = DEFAULT_MODEL_NAME,
+    priority: int = PRIORITY_STANDARD,
+    output_tokens: int = DEFAULT_OUTPUT_TOKENS,
+):
+    """
+    Yields response text from Gemini as it is generated. Streams are admitted and
+    paced like other calls but are not retried or hedged.
+    """
+    try:
+        async with llm_admission.slot(priority):
+            estimated_tokens = estimate_tokens(prompt) + output_tokens
+            await gemini_quota.acquire(estimated_tokens)
+            model = gemini_models.get(model_name, GENERATION_CONFIG)
+            response = await model.generate_content_async(
+                contents=[prompt],
+                stream=True,
+                request_options={"timeout": LLM_DEADLINE_SECONDS, "retry": None},
+            )
+            usage = None
+            async for chunk in response:
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                if chunk.parts:
+                    yield chunk.text
+            if usage and usage.total_token_count:
+                gemini_quota.settle(estimated_tokens, usage.total_token_count)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise gemini_error_to_http(e)
+
+
+class JSONFieldStream:
+    """
+    Incrementally scans a streamed JSON object and returns each top-level member
+    as soon as its value is complete.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._member_start = 0
+
+    def feed(self, chunk: str) -> list:
+        """Adds a chunk of text and returns the newly completed (key, value) pairs."""
+        self._buffer += chunk
+        members = []
+        while self._position < len(self._buffer):
+            char = self._buffer[self._position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._member_start = self._position + 1
+            elif char in "}]" or (char == "," and self._depth == 1):
+                if self._depth == 1:
+                    members.extend(self._parse_member(self._member_start, self._position))
+                    self._member_start = self._position + 1
+                if char != ",":
+                    self._depth -= 1
+            self._position += 1
+        return members
+
+    def _parse_member(self, start: int, end: int) -> list:
+        member = self._buffer[start:end].strip()
+        if not member:
+            return []
+        try:
+            return list(json.loads("{" + member + "}").items())
+        except ValueError:
+            return []
+
+
+def sse_event(event: str, data) -> str:
+    """Formats a Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_llm_json(
+    prompt: str,
+    use_cache: bool = True,
+    model_name: str = DEFAULT_MODEL_NAME,
+    priority: int = PRIORITY_STANDARD,
+    output_tokens: int = DEFAULT_OUTPUT_TOKENS,
+    local_fields: dict = None,
+) -> StreamingResponse:
+    """
+    Streams a JSON-producing prompt to the client as Server-Sent Events: a `field`
+    event per top-level key as soon as it is complete, then a `done` event with the
+    whole object (or an `error` event). Cached responses are replayed immediately.
+    `local_fields` are computed without the LLM: they are sent first and take
+    precedence over LLM fields of the same name.
+    """
+    local_fields = local_fields or {}
+    key = llm_cache_key(prompt, model_name, GENERATION_CONFIG)
+    cached = await response_cache.get(key) if use_cache else None
+    chunks = None
+    if cached is not None:
+        first = cached
+    else:
+        chunks = stream_gemini(prompt, model_name, priority, output_tokens)
+        # Wait for the first chunk so admission and upstream errors are still
+        # returned as regular HTTP errors
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = ""
+
+    async def all_chunks():
+        yield first
+        if chunks is not None:
+            async for chunk in chunks:
+                yield chunk
+
+    async def events():
+        for field, value in local_fields.items():
+            yield sse_event("field", {"key": field, "value": value})
+        parser = JSONFieldStream()
+        parts = []
+        try:
+            async for chunk in all_chunks():
+                parts.append(chunk)
+                for field, value in parser.feed(chunk):
+                    if field not in local_fields:
+                        yield sse_event("field", {"key": field, "value": value})
+        except HTTPException as e:
+            yield sse_event("error", {"detail": e.detail})
+            return
+        finally:
+            # Release the upstream stream (and its admission slot) if the client left
+            if chunks is not None:
+                await chunks.aclose()
+        text = "".join(parts)
+        try:
+            result = json.loads(text)
+        except ValueError:
+            yield sse_event("error", {"detail": "Gemini LLM returned malformed JSON."})
+            return
+        if cached is None:
+            await response_cache.set(key, text)
+        yield sse_event("done", merge_local_fields(result, local_fields))
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
+
+
+class AugmentRequest(BaseModel):
+    bullet_point: str
+
+
+AUGMENT_CRITERIA = (
+    "1. Action Verb: Starts with a strong, clear action verb relevant to the skill or task.\n"
+    "2. Quantifiable Impact: Includes specific numbers, percentages, or measurable outcomes.\n"
+    "3. Skill Relevance: Uses relevant keywords or skills.\n"
+    "4. Length and Clarity: Maintains a professional tone, keeps the bullet between 50–150 characters, and avoids unnecessary filler words.\n\n"
+)
+
+
+def build_augment_prompt(bullet_point: str) -> str:
+    """Builds the /augment prompt for a single bullet point."""
+    return (
+        f"Using the bullet point provided, rewrite it as three augmented resume bullet point options that maximize impact across the following categories:\n\n"
+        f"{AUGMENT_CRITERIA}"
+        f"Original Bullet Point:\n"
+        f"{bullet_point}\n\n"
+        f"Augment the given text by providing 3 options.\n\n"
+        f"Expected LLM JSON format: {{\"options\": [\"option1\", \"option2\", \"option3\"]}}\n\n"
+        f"Return only the JSON object, no extra commentary."
+    )
+
+
+def build_augment_batch_prompt(bullet_points: dict) -> str:
+    """Builds one prompt augmenting several bullet points, keyed by id."""
+    bullets = "".join(f"[{key}] {text}\n" for key, text in bullet_points.items())
+    return (
+        f"Using each bullet point provided, rewrite it as three augmented resume bullet point options that maximize impact across the following categories:\n\n"
+        f"{AUGMENT_CRITERIA}"
+        f"Original Bullet Points (each prefixed with its id in brackets):\n"
+        f"{bullets}\n"
+        f"Augment each bullet point independently by providing 3 options for it.\n\n"
+        f"Expected LLM JSON format: {{\"<id>\": {{\"options\": [\"option1\", \"option2\", \"option3\"]}}, ...}} with one entry per id.\n\n"
+        f"Return only the JSON object, no extra commentary."
+    )
+
+
+def pack_augment_batches(bullet_points: list, token_budget: int) -> list:
+    """
+    Greedily groups bullet point indexes into batches whose estimated prompt and
+    output tokens stay within `token_budget`. Every batch holds at least one bullet.
+    """
+    preamble_tokens = estimate_tokens(build_augment_batch_prompt({}))
+    batches = []
+    current, current_tokens = [], preamble_tokens
+    for index, bullet_point in enumerate(bullet_points):
+        cost = estimate_tokens(bullet_point) + AUGMENT_OUTPUT_TOKENS
+        if current and current_tokens + cost > token_budget:
+            batches.append(current)
+            current, current_tokens = [], preamble_tokens
+        current.append(index)
+        current_tokens += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+@app.post("/augment")
+async def augment_text(
+    request: AugmentRequest,
+    bypass_cache: bool = Header(False, alias="X-Cache-Bypass"),
+):
+    """
+    Augments a given resume bullet point into three improved options.
+    Expected LLM JSON format: {"options": ["option1", "option2", "option3"]}
+    """
+    prompt = build_augment_prompt(request.bullet_point)
+    llm_response_str = await call_gemini_llm(
+        prompt,
+        use_cache=not bypass_cache,
+        priority=PRIORITY_INTERACTIVE,
+        output_tokens=AUGMENT_OUTPUT_TOKENS,
+    )
+    return JSONResponse(content=json.loads(llm_response_str))
+
+
+class AugmentBatchRequest(BaseModel):
+    bullet_points: list[str]
+
+
+@app.post("/augment/batch")
+async def augment_batch(
+    request: AugmentBatchRequest,
+    bypass_cache: bool = Header(False, alias="X-Cache-Bypass"),
+):
+    """
+    Augments many bullet points, packing as many as fit the token budget into
+    each Gemini call. Results are returned in input order, each with either
+    "options" or an "error", so one bad batch doesn't fail the whole request.
+    """
+    if len(request.bullet_points) > AUGMENT_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {AUGMENT_BATCH_MAX_ITEMS} bullet points can be augmented at once.",
+        )
+    batches = pack_augment_batches(request.bullet_points, AUGMENT_BATCH_TOKEN_BUDGET)
+
+    async def run_batch(indexes: list) -> dict:
+        prompt = build_augment_batch_prompt(
+            {str(number): request.bullet_points[index] for number, index in enumerate(indexes, 1)}
+        )
+        llm_response_str = await call_gemini_llm(
+            prompt,
+            use_cache=not bypass_cache,
+            output_tokens=AUGMENT_OUTPUT_TOKENS * len(indexes),
+        )
+        return json.loads(llm_response_str)
+
+    responses = await asyncio.gather(
+        *(run_batch(indexes) for indexes in batches), return_exceptions=True
+    )
+    results = [None] * len(request.bullet_points)
+    for indexes, response in zip(batches, responses):
+        for number, index in enumerate(indexes, 1):
+            result = {"bullet_point": request.bullet_points[index]}
+            if isinstance(response, HTTPException):
+                result["error"] = response.detail
+            elif isinstance(response, Exception):
+                result["error"] = "Gemini LLM returned malformed JSON."
+            else:
+                entry = response.get(str(number)) if isinstance(response, dict) else None
+                options = entry.get("options") if isinstance(entry, dict) else None
+                if isinstance(options, list) and options:
+                    result["options"] = options
+                else:
+                    result["error"] = "Gemini LLM returned no options for this bullet point."
+            results[index] = result
+    return JSONResponse(content={"results": results, "llm_calls": len(batches)})
+
+
+class JSONArrayTextStream:
+    """
+    Incrementally scans a streamed JSON object for the string items of one top-level
+    array member (e.g. "options") and returns their text as it arrives.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string = []
+        self._last_string = None
+        self._in_target = False
+        self._index = -1
+        self._sent = 0
+
+    def feed(self, chunk: str) -> list:
+        """Adds a chunk of text and returns new (item index, text delta) pairs."""
+        deltas = []
+        for char in chunk:
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    self._emit(deltas, complete=True)
+                    self._last_string = "".join(self._string)
+                    continue
+                self._string.append(char)
+            elif char == '"':
+                self._in_string = True
+                self._string = []
+                self._sent = 0
+                if self._in_target and self._depth == 2:
+                    self._index += 1
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 2 and char == "[":
+                    self._in_target = self._last_string == self.key
+            elif char in "}]":
+                if self._depth == 2:
+                    self._in_target = False
+                self._depth -= 1
+        self._emit(deltas)
+        return deltas
+
+    def _emit(self, deltas: list, complete: bool = False):
+        if not (self._in_target and self._depth == 2 and (self._in_string or complete)):
+            return
+        raw = "".join(self._string)
+        # Drop a trailing escape sequence that hasn't fully arrived yet
+        for cut in range(0, 7):
+            try:
+                text = json.loads('"' + raw[: len(raw) - cut] + '"')
+                break
+            except ValueError:
+                continue
+        else:
+            return
+        if len(text) > self._sent:
+            deltas.append((self._index, text[self._sent :]))
+            self._sent = len(text)
+
+
+async def stream_augment_options(
+    websocket: WebSocket, send_lock: asyncio.Lock, slot, bullet_point: str
+):
+    """Streams the augmented options for one bullet point over the WebSocket."""
+
+    async def send(message: dict):
+        async with send_lock:
+            await websocket.send_json({"slot": slot, **message})
+
+    prompt = build_augment_prompt(bullet_point)
+    key = llm_cache_key(prompt, DEFAULT_MODEL_NAME, GENERATION_CONFIG)
+    try:
+        text = await response_cache.get(key)
+        if text is None:
+            parser = JSONArrayTextStream("options")
+            parts = []
+            chunks = stream_gemini(
+                prompt, priority=PRIORITY_INTERACTIVE, output_tokens=AUGMENT_OUTPUT_TOKENS
+            )
+            try:
+                async for chunk in chunks:
+                    parts.append(chunk)
+                    for index, delta in parser.feed(chunk):
+                        await send({"event": "delta", "option": index, "text": delta})
+            finally:
+                await chunks.aclose()
+            text = "".join(parts)
+            result = json.loads(text)
+            await response_cache.set(key, text)
+        else:
+            result = json.loads(text)
+        await send({"event": "done", **result})
+    except HTTPException as e:
+        await send({"event": "error", "detail": e.detail})
+    except ValueError:
+        await send({"event": "error", "detail": "Gemini LLM returned malformed JSON."})
+
+
+@app.websocket("/augment/ws")
+async def augment_websocket(websocket: WebSocket):
+    """
+    Streams /augment results over one WebSocket connection.
+    Client messages: {"slot": <id>, "bullet_point": "..."}. A new bullet for a slot
+    cancels the one still in progress for that slot.
+    Server messages carry the slot and an event: "delta" (option index and text),
+    "done" (the full {"options": [...]}), "cancelled" or "error".
+    """
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+    tasks = {}
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                async with send_lock:
+                    await websocket.send_json(
+                        {"slot": None, "event": "error", "detail": "Messages must be JSON objects."}
+                    )
+                continue
+            slot = message.get("slot")
+            bullet_point = message.get("bullet_point")
+            # Slots key the task table, so only JSON scalars are accepted
+            if slot is not None and not isinstance(slot, (str, int, float, bool)):
+                detail = "slot must be a string or a number."
+            elif not isinstance(bullet_point, str) or not bullet_point.strip():
+                detail = "bullet_point is required."
+            else:
+                detail = None
+            if detail:
+                async with send_lock:
+                    await websocket.send_json({"slot": slot, "event": "error", "detail": detail})
+                continue
+            previous = tasks.get(slot)
+            if previous is not None and not previous.done():
+                previous.cancel()
+                async with send_lock:
+                    await websocket.send_json({"slot": slot, "event": "cancelled"})
+            tasks[slot] = asyncio.create_task(
+                stream_augment_options(websocket, send_lock, slot, bullet_point)
+            )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks.values():
+            task.cancel()
+
+
+STOPWORDS = frozenset(
+    "a about above after again against all also am an and any are as at be because been "
+    "before being below between both but by can could did do does doing down during each "
+    "etc few for from further had has have having he her here hers him his how i if in "
+    "into is it its itself just me more most my no nor not now of off on once only or "
+    "other our ours out over own per same she should so some such than that the their "
+    "theirs them then there these they this those through to too under until up us very "
+    "via was we were what when where which while who whom why will with within would you "
+    "your yours".split()
+)
+
+# Word tokens, keeping tech spellings like c++, c#, node.js and .net intact
+WORD_PATTERN = re.compile(r"(?<![A-Za-z0-9])\.?[A-Za-z0-9](?:[A-Za-z0-9+#.]*[A-Za-z0-9+#])?")
+
+
+def tokenize(text: str) -> list:
+    """Lowercased word tokens minus stopwords."""
+    return [token for token in WORD_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+SKILLS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "skills.json")
+
+# Keywords returned by /grader are computed locally ("local", the field is dropped from
+# the prompt) or requested from the LLM as before ("llm")
+GRADER_KEYWORDS_SOURCE = os.environ.get("GRADER_KEYWORDS_SOURCE", "local")
+LOCAL_KEYWORDS_MIN = 5
+LOCAL_KEYWORDS_MAX = int(os.environ.get("LOCAL_KEYWORDS_MAX", "15"))
+
+# "Keyword difference" in comparisons: "local" computes it with the skill vocabulary and
+# drops it from the prompt, "both" keeps the LLM's answer and adds the local "KeywordGap",
+# "llm" asks the LLM only
+COMPARISON_KEYWORDS_SOURCE = os.environ.get("COMPARISON_KEYWORDS_SOURCE", "local")
+
+# /grader answers without the LLM when the extracted text has fewer words than this
+# (scanned PDFs, empty or stub files)
+GRADER_MIN_WORDS = int(os.environ.get("GRADER_MIN_WORDS", "40"))
+# ...or when the local grade is an A or an F with at least this confidence (0-1);
+# values above 1 disable it
+LLM_SKIP_CONFIDENCE = float(os.environ.get("LLM_SKIP_CONFIDENCE", "1.1"))
+
+
+class AhoCorasick:
+    """
+    Aho–Corasick automaton over token sequences: finds every occurrence of every
+    pattern in a single pass over the input tokens.
+    """
+
+    def __init__(self, patterns):
+        """`patterns` is an iterable of (tokens, value) pairs."""
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for tokens, value in patterns:
+            state = 0
+            for token in tokens:
+                if token not in self._goto[state]:
+                    self._goto[state][token] = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = self._goto[state][token]
+            self._output[state].append((len(tokens), value))
+        # Breadth-first pass to link each state to its longest proper suffix state
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(token, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
 
-load_dotenv()
+    def scan(self, tokens):
+        """Yields (start index, length, value) for every pattern occurrence."""
+        state = 0
+        for index, token in enumerate(tokens):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for length, value in self._output[state]:
+                yield index - length + 1, length, value
 
-# Configure Gemini API key from environment variable
-genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
 
+class SkillVocabulary:
+    """
+    Curated skill names and aliases from skills.json, compiled into an Aho–Corasick
+    automaton over lowercased tokens. Forms listed as case-sensitive (e.g. "Go",
+    "React") only match with that exact casing; everything else matches
+    case-insensitively.
+    """
 
-app = FastAPI()
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Adjust this to your frontend domain in production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    def __init__(self, path: str):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        case_sensitive = set(data["case_sensitive"])
+        patterns = []
+        # Lowercased words of every skill form, which normalize_text treats as known
+        self.words = set()
+        for skill, aliases in data["skills"].items():
+            for form in [skill, *aliases]:
+                tokens = tuple(WORD_PATTERN.findall(form))
+                self.words.update(token.lower() for token in tokens)
+                exact = tokens if form in case_sensitive else None
+                patterns.append((tuple(token.lower() for token in tokens), (skill, exact)))
+        self.automaton = AhoCorasick(patterns)
 
+    def find(self, text: str) -> list:
+        """
+        Returns the canonical skills mentioned in `text`, in order of appearance.
+        Overlapping matches resolve to the longest (e.g. "Spring Boot", not "Spring").
+        """
+        tokens = WORD_PATTERN.findall(text)
+        matches = sorted(
+            (start, -length, skill)
+            for start, length, (skill, exact) in self.automaton.scan(
+                [token.lower() for token in tokens]
+            )
+            if exact is None or tuple(tokens[start : start + length]) == exact
+        )
+        found = []
+        covered_until = 0
+        for start, negative_length, skill in matches:
+            if start >= covered_until:
+                found.append(skill)
+                covered_until = start - negative_length
+        return found
 
-def extract_text_from_pdf(file: UploadFile) -> str:
-    """Extracts text from a PDF file."""
-    try:
-        reader = PdfReader(io.BytesIO(file.file.read()))
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or ""
-        return text
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error processing PDF: {e}")
+    def gap(self, resume_text: str, job_application_text: str) -> dict:
+        """Skills the job asks for that the resume lacks, and vice versa."""
+        return self.gap_from_skills(set(self.find(resume_text)), job_application_text)
 
+    def gap_from_skills(self, resume_skills: set, job_application_text: str) -> dict:
+        """Like gap, for a resume whose skills have already been found."""
+        job_skills = list(dict.fromkeys(self.find(job_application_text)))
+        return {
+            "MissingFromResume": [skill for skill in job_skills if skill not in resume_skills],
+            "NotInJobDescription": sorted(resume_skills.difference(job_skills), key=str.lower),
+        }
 
-def extract_text_from_docx(file: UploadFile) -> str:
-    """Extracts text from a DOCX file."""
-    try:
-        document = Document(io.BytesIO(file.file.read()))
-        text = ""
-        for paragraph in document.paragraphs:
-            text += paragraph.text + "\n"
-        return text
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error processing DOCX: {e}")
 
+skill_vocabulary = SkillVocabulary(SKILLS_PATH)
 
-def extract_text_from_text_file(file: UploadFile) -> str:
-    """Extracts text from a plain text file."""
-    try:
-        return file.file.read().decode("utf-8")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error processing text file: {e}")
+
+def rake_phrases(text: str) -> list:
+    """
+    Ranks candidate key phrases RAKE-style: phrases are runs of non-stopwords between
+    punctuation, and each is scored by the sum of its words' degree/frequency.
+    """
+    phrases = []
+    for fragment in re.split(r"[\n.,;:!?()\[\]{}|•●▪\u2013\u2014/\\\"']+", text.lower()):
+        phrase = []
+        for token in WORD_PATTERN.findall(fragment) + [None]:
+            if token is None or token in STOPWORDS or token.isdigit():
+                if 0 < len(phrase) <= 3:
+                    phrases.append(tuple(phrase))
+                phrase = []
+            else:
+                phrase.append(token)
+    frequency = Counter(word for phrase in phrases for word in phrase)
+    degree = Counter()
+    for phrase in phrases:
+        for word in phrase:
+            degree[word] += len(phrase)
+    scores = {}
+    for phrase in set(phrases):
+        scores[" ".join(phrase)] = sum(degree[word] / frequency[word] for word in phrase)
+    return sorted(scores, key=lambda phrase: (-scores[phrase], phrase))
 
 
-async def call_gemini_llm(prompt: str, model_name: str = "gemini-2.5-flash"):
+def extract_keywords(text: str, limit: int = LOCAL_KEYWORDS_MAX) -> list:
     """
-    Makes a service call to the Gemini LLM and returns the generated text.
-    Assumes the LLM will return a JSON string.
+    Deterministically extracts resume keywords: curated skills first (most mentioned
+    first), topped up with RAKE phrases from the section bodies when fewer than
+    LOCAL_KEYWORDS_MIN skills are found.
     """
-    try:
-        model = genai.GenerativeModel(model_name)
-        response = await model.generate_content_async(
-            contents=[prompt],
-            generation_config=genai.types.GenerationConfig(
-                response_mime_type="application/json"
-            ),
-        )
-        # Return the JSON string to be parsed by FastAPI's JSONResponse
-        return response.text
-    except Exception as e:
-        raise HTTPException(
-            status_code=500, detail=f"Error communicating with Gemini LLM: {e}"
-        )
+    mentions = skill_vocabulary.find(text)
+    counts = Counter(mentions)
+    first_seen = {skill: index for index, skill in reversed(list(enumerate(mentions)))}
+    keywords = sorted(counts, key=lambda skill: (-counts[skill], first_seen[skill]))[:limit]
+    if len(keywords) < LOCAL_KEYWORDS_MIN:
+        seen = {keyword.lower() for keyword in keywords}
+        # Leave out the headings and the name/contact block above the first one
+        sections = split_sections(text, HEADING_SECTIONS)
+        if len(sections) > 1:
+            text = "\n".join(line for _, lines in sections[1:] for line in lines[1:])
+        for phrase in rake_phrases(text):
+            if len(keywords) >= LOCAL_KEYWORDS_MIN:
+                break
+            if phrase not in seen and len(phrase) > 2 and not skill_vocabulary.find(phrase):
+                keywords.append(phrase)
+                seen.add(phrase)
+    return keywords
 
 
-class AugmentRequest(BaseModel):
-    bullet_point: str
+SECTION_HEADINGS = {
+    "summary": ("summary", "professional summary", "objective", "profile", "about me", "about"),
+    "experience": (
+        "experience",
+        "work experience",
+        "professional experience",
+        "relevant experience",
+        "employment",
+        "employment history",
+        "work history",
+    ),
+    "projects": ("projects", "personal projects", "selected projects", "side projects"),
+    "education": ("education", "academic background", "education and certifications"),
+    "skills": (
+        "skills",
+        "technical skills",
+        "skills and technologies",
+        "technologies",
+        "core competencies",
+        "tools",
+    ),
+    "certifications": ("certifications", "certificates", "licenses and certifications"),
+    "awards": ("awards", "honors", "honors and awards", "achievements"),
+    "publications": ("publications", "papers", "talks", "presentations"),
+    "activities": ("activities", "volunteering", "volunteer experience", "leadership", "interests"),
+    "references": ("references",),
+}
+HEADING_SECTIONS = {
+    heading: section for section, headings in SECTION_HEADINGS.items() for heading in headings
+}
+# Standard order of the sections; education may appear anywhere (new graduates lead with it)
+SECTION_ORDER = ("summary", "experience", "projects", "skills")
 
+ACTION_VERBS = frozenset(
+    "accelerated achieved acquired adapted administered advised analyzed architected "
+    "assembled assessed audited authored automated balanced boosted built calculated "
+    "captured championed coached collaborated completed composed conceived conducted "
+    "configured consolidated constructed consulted contributed converted coordinated "
+    "created cultivated cut debugged decreased defined delivered deployed designed "
+    "detected developed devised diagnosed directed discovered doubled drove eliminated "
+    "enabled engineered enhanced established evaluated executed expanded expedited "
+    "facilitated forecasted formulated founded generated grew guided halved headed "
+    "identified implemented improved increased influenced initiated innovated inspected "
+    "installed instituted integrated introduced invented investigated launched led "
+    "leveraged maintained managed maximized mentored migrated minimized modeled "
+    "modernized monitored negotiated optimized orchestrated organized overhauled "
+    "oversaw partnered performed pioneered planned prepared presented prioritized "
+    "produced programmed promoted prototyped published raised rebuilt recommended "
+    "redesigned reduced refactored remodeled reorganized replaced researched resolved "
+    "restructured revamped reviewed saved scaled secured shipped simplified solved "
+    "spearheaded standardized steered streamlined strengthened structured supervised "
+    "supported surpassed synthesized tested trained transformed translated tripled "
+    "troubleshot unified upgraded validated wrote".split()
+)
+BULLET_PREFIX = re.compile(r"^\s*[•●▪◦‣∙·*\-–—]\s*")
+QUANTIFIED = re.compile(r"\d|%|\$|€|£")
+WORDS_PER_PAGE = 550
 
-@app.post("/augment")
-async def augment_text(request: AugmentRequest):
+
+def local_grade(text: str) -> dict:
     """
-    Augments a given resume bullet point into three improved options.
-    Expected LLM JSON format: {"options": ["option1", "option2", "option3"]}
+    Scores the rule-checkable /grader criteria without the LLM: standard section
+    headings and their order, bullets starting with action verbs, bullets with
+    numbers, and length. Returns the measurements with a provisional Score/Grade.
     """
-    prompt = (
-        f"Using the bullet point provided, rewrite it as three augmented resume bullet point options that maximize impact across the following categories:\n\n"
-        f"1. Action Verb: Starts with a strong, clear action verb relevant to the skill or task.\n"
-        f"2. Quantifiable Impact: Includes specific numbers, percentages, or measurable outcomes.\n"
-        f"3. Skill Relevance: Uses relevant keywords or skills.\n"
-        f"4. Length and Clarity: Maintains a professional tone, keeps the bullet between 50–150 characters, and avoids unnecessary filler words.\n\n"
-        f"Original Bullet Point:\n"
-        f"{request.bullet_point}\n\n"
-        f"Augment the given text by providing 3 options.\n\n"
-        f"Expected LLM JSON format: {{\"options\": [\"option1\", \"option2\", \"option3\"]}}\n\n"
-        f"Return only the JSON object, no extra commentary."
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    sections = []
+    bullets = []
+    current_section = None
+    for line in lines:
+        heading = HEADING_SECTIONS.get(line.lower().strip(" :"))
+        if heading and len(line) <= 40:
+            current_section = heading
+            if heading not in sections:
+                sections.append(heading)
+        elif BULLET_PREFIX.match(line):
+            bullets.append(BULLET_PREFIX.sub("", line))
+        elif current_section in ("experience", "projects") and len(line.split()) >= 6:
+            # pypdf often drops bullet glyphs; long lines in these sections are bullets
+            bullets.append(line)
+    ordered = [SECTION_ORDER.index(section) for section in sections if section in SECTION_ORDER]
+    in_order = ordered == sorted(ordered)
+    first_words = [bullet.split()[0].lower().strip(",.;:") for bullet in bullets if bullet.split()]
+    action_ratio = sum(word in ACTION_VERBS for word in first_words) / len(bullets) if bullets else 0.0
+    quantified_ratio = (
+        sum(bool(QUANTIFIED.search(bullet)) for bullet in bullets) / len(bullets) if bullets else 0.0
     )
-    llm_response_str = await call_gemini_llm(prompt)
-    return JSONResponse(content=json.loads(llm_response_str))
+    word_count = len(text.split())
+    pages = word_count / WORDS_PER_PAGE
+
+    section_points = 6 * sum(s in sections for s in ("experience", "education", "skills"))
+    section_points += 7 if in_order and len(ordered) > 1 else 0
+    action_points = 25 * action_ratio
+    quantified_points = 25 * min(1.0, quantified_ratio / 0.5)
+    if word_count < 150:
+        length_points = 5 * word_count / 150
+    elif pages <= 1:
+        length_points = 25
+    else:
+        length_points = max(0.0, 25 - 10 * (pages - 1))
+    score = round(section_points + action_points + quantified_points + length_points)
+    # Confidence grows with the evidence measured (bullets, words) and with the
+    # distance of the score from the middle of the scale
+    evidence = min(1.0, len(bullets) / 5) * min(1.0, word_count / 200)
+    confidence = evidence * min(1.0, abs(score - 70) / 30)
+    return {
+        "Sections": sections,
+        "SectionsInOrder": in_order,
+        "BulletCount": len(bullets),
+        "ActionVerbRatio": round(action_ratio, 2),
+        "QuantifiedRatio": round(quantified_ratio, 2),
+        "WordCount": word_count,
+        "EstimatedPages": round(max(pages, 0.1), 1),
+        "Score": score,
+        "Grade": score_to_grade(score),
+        "Confidence": round(confidence, 2),
+    }
 
 
-@app.post("/grader")
-async def grade_document(file: UploadFile = File(...)):
+def score_to_grade(score: int) -> str:
+    for threshold, grade in ((90, "A"), (80, "B"), (70, "C"), (60, "D")):
+        if score >= threshold:
+            return grade
+    return "F"
+
+
+# Token budgets for the resume and job description text interpolated into prompts
+PROMPT_RESUME_TOKEN_BUDGET = int(os.environ.get("PROMPT_RESUME_TOKEN_BUDGET", "4000"))
+PROMPT_JOB_TOKEN_BUDGET = int(os.environ.get("PROMPT_JOB_TOKEN_BUDGET", "2000"))
+
+# Resume sections in the order they're kept when the text exceeds its budget; the
+# lines before the first heading (name, contact details) come first
+RESUME_SECTION_PRIORITY = (
+    None,
+    "experience",
+    "skills",
+    "projects",
+    "education",
+    "summary",
+    "certifications",
+    "awards",
+    "activities",
+    "publications",
+    "references",
+)
+JOB_SECTION_HEADINGS = {
+    "requirements": (
+        "requirements",
+        "qualifications",
+        "minimum qualifications",
+        "basic qualifications",
+        "required qualifications",
+        "what you'll need",
+        "what you bring",
+        "what we're looking for",
+        "must have",
+    ),
+    "responsibilities": (
+        "responsibilities",
+        "key responsibilities",
+        "what you'll do",
+        "the role",
+        "about the role",
+        "your role",
+    ),
+    "preferred": (
+        "preferred qualifications",
+        "nice to have",
+        "nice to haves",
+        "bonus points",
+        "pluses",
+    ),
+    "about": ("about us", "about the company", "who we are", "company overview", "about the team"),
+    "benefits": (
+        "benefits",
+        "perks",
+        "perks and benefits",
+        "what we offer",
+        "compensation",
+        "compensation and benefits",
+    ),
+}
+JOB_HEADING_SECTIONS = {
+    heading: section
+    for section, headings in JOB_SECTION_HEADINGS.items()
+    for heading in headings
+}
+JOB_SECTION_PRIORITY = ("requirements", "responsibilities", None, "preferred", "about")
+# Job description sections that never help the comparison
+JOB_BOILERPLATE_SECTIONS = frozenset({"benefits"})
+BOILERPLATE_LINE = re.compile(
+    r"equal (employment )?opportunity|without regard to (race|age|sex)|"
+    r"reasonable accommodation|e-verify|affirmative action|protected veteran|"
+    r"^\s*(page\s+\d+(\s+of\s+\d+)?|\d{1,3}\s*(/|of)\s*\d{1,3})\s*$",
+    re.IGNORECASE,
+)
+
+
+def split_sections(text: str, heading_sections: dict) -> list:
+    """Splits text into [section, lines] pairs at recognised headings; section is None before the first."""
+    sections = [[None, []]]
+    for line in text.splitlines():
+        heading = heading_sections.get(line.strip().lower().strip(" :"))
+        if heading and len(line.strip()) <= 40:
+            sections.append([heading, []])
+        sections[-1][1].append(line)
+    return sections
+
+
+def strip_boilerplate(sections: list, drop_sections=frozenset()) -> list:
     """
-    Grades a document (PDF, DOCX, or text) and returns detailed feedback from the LLM.
-    Expected LLM JSON format aligns with the new prompt requirements.
+    Removes EEO statements, page numbers and whole `drop_sections`. PDF page headers
+    and footers are already gone (strip_page_headers runs at extraction).
     """
-    file_content = ""
-    if file.filename.endswith(".pdf"):
-        file_content = extract_text_from_pdf(file)
-    elif file.filename.endswith(".docx"):
-        file_content = extract_text_from_docx(file)
-    elif file.filename.endswith(".txt"):
-        file_content = extract_text_from_text_file(file)
-    else:
-        raise HTTPException(
-            status_code=400,
-            detail="Unsupported file type. Only PDF, DOCX, and TXT are supported.",
+    stripped = []
+    for section, lines in sections:
+        if section in drop_sections:
+            continue
+        kept = []
+        for index, line in enumerate(lines):
+            if section is not None and index == 0:
+                # The heading itself
+                kept.append(line)
+                continue
+            if BOILERPLATE_LINE.search(line):
+                continue
+            kept.append(line)
+        stripped.append([section, kept])
+    return stripped
+
+
+def cut_at_word(line: str, limit: int) -> str:
+    """
+    Returns the longest prefix of `line` of at most `limit` characters that ends at
+    a word boundary, or a hard cut when the first word alone is longer.
+    """
+    if limit <= 0:
+        return ""
+    if len(line) <= limit:
+        return line
+    boundary = line.rfind(" ", 0, limit + 1)
+    return (line[:boundary] if boundary > 0 else line[:limit]).rstrip()
+
+
+def fit_to_token_budget(
+    text: str, budget: int, heading_sections: dict, priority: tuple, drop_sections=frozenset()
+):
+    """
+    Strips boilerplate and, if the text is still over `budget` tokens, keeps whole
+    sections in `priority` order (unlisted sections last) while they fit, then
+    truncates the remaining ones into what's left, at a line boundary or inside
+    the line that doesn't fit at a word boundary. The original section order is
+    preserved. Returns the text and a report of what was cut, or None if the text
+    was left untouched.
+    """
+    original_tokens = estimate_tokens(text)
+    sections = strip_boilerplate(split_sections(text, heading_sections), drop_sections)
+    texts = ["\n".join(lines) for _, lines in sections]
+    stripped_tokens = estimate_tokens("\n".join(texts))
+    cut_sections = []
+    if stripped_tokens > budget:
+        rank = {section: index for index, section in enumerate(priority)}
+        order = sorted(
+            range(len(sections)), key=lambda i: (rank.get(sections[i][0], len(priority)), i)
         )
+        costs = [estimate_tokens(part) for part in texts]
+        remaining = budget
+        whole = set()
+        for i in order:
+            if costs[i] <= remaining:
+                whole.add(i)
+                remaining -= costs[i]
+        # What's left goes to the sections that didn't fit, in priority order
+        for i in order:
+            if i in whole:
+                continue
+            cut_sections.append(sections[i][0] or "header")
+            kept = []
+            size = 0
+            for line in sections[i][1]:
+                if (size + len(line) + 1) // 4 >= remaining:
+                    # Keep the part of the line that fits (pasted text or joined
+                    # paragraphs can put a whole section on one line); four characters
+                    # are left for the marker and the estimate's rounding
+                    partial = cut_at_word(line, remaining * 4 - size - len("\n[...]") - 4)
+                    if partial:
+                        kept.append(partial)
+                    break
+                size += len(line) + 1
+                kept.append(line)
+            texts[i] = "\n".join(kept + ["[...]"]) if kept else ""
+            remaining -= estimate_tokens(texts[i]) if kept else 0
+    trimmed = "\n".join(part for part in texts if part)
+    if trimmed.strip() == text.strip():
+        return text, None
+    prompt_tokens = estimate_tokens(trimmed)
+    return trimmed, {
+        "OriginalTokens": original_tokens,
+        "PromptTokens": prompt_tokens,
+        "BoilerplateTokensRemoved": max(0, original_tokens - stripped_tokens),
+        "TruncatedTokens": max(0, stripped_tokens - prompt_tokens),
+        "SectionsCut": list(dict.fromkeys(cut_sections)),
+    }
+
+
+def fit_resume_to_budget(resume_content: str):
+    return fit_to_token_budget(
+        resume_content, PROMPT_RESUME_TOKEN_BUDGET, HEADING_SECTIONS, RESUME_SECTION_PRIORITY
+    )
+
+
+def fit_job_to_budget(job_application_text: str):
+    return fit_to_token_budget(
+        job_application_text,
+        PROMPT_JOB_TOKEN_BUDGET,
+        JOB_HEADING_SECTIONS,
+        JOB_SECTION_PRIORITY,
+        JOB_BOILERPLATE_SECTIONS,
+    )
 
-    prompt = (
+
+def build_grader_prompt(file_content: str, include_keywords: bool = True) -> str:
+    """
+    Builds the /grader prompt for the extracted resume text. With
+    `include_keywords=False` the LLM isn't asked for "Keywords".
+    """
+    keywords_field = (
+        f"- \"Keywords\": Array of ≥5 unique, high-impact technical keywords found.\n"
+        if include_keywords
+        else ""
+    )
+    return (
         f"You are an expert resume evaluator specializing in various roles at FAANG/MANGA-level companies.\n\n"
         f"Analyze the following resume content and produce a structured JSON assessment focusing on both ATS optimization and recruiter-readability. Use the following evaluation criteria inspired by Tech Interview Handbook:\n\n"
         f"1. ATS‑friendly formatting: Are sections (e.g., “Work Experience”, “Skills”) clear and in standard order? Is the font/plain text optimized for parsing?\n"
@@ -136,7 +2395,7 @@ async def grade_document(file: UploadFile = File(...)):
         f"4. Keyword relevance: Does the text include at least 5 role-specific keywords from the target job description?\n"
         f"5. Brevity & formatting: Is the resume one page? Are fonts standard and margins reasonable? Is it easy to scan?\n\n"
         f"Return only a JSON object with these keys:\n\n"
-        f"- \"Keywords\": Array of ≥5 unique, high-impact technical keywords found.\n"
+        f"{keywords_field}"
         f"- \"SectionFormatting\": \"ok\" or \"needs work\" based on section headings & order, with short reasoning.\n"
         f"- \"ClarityAction\": \"ok\" or \"needs work\" with brief note on action verbs/phrasing.\n"
         f"- \"QuantifiableImpact\": \"ok\" or \"needs work\" with note on presence or absence of measurable results.\n"
@@ -148,48 +2407,697 @@ async def grade_document(file: UploadFile = File(...)):
         f"- \"Improvements\": 3–4 sentence summary of key areas to improve.\n\n"
         f"Resume Content: \n\"{file_content}\""
     )
-    llm_response_str = await call_gemini_llm(prompt)
-    return JSONResponse(content=json.loads(llm_response_str))
+
+
+def build_comparison_prompt(
+    resume_content: str, job_application_text: str, include_keyword_difference: bool = True
+) -> str:
+    """
+    Builds the /comparison prompt for a resume and a job description. With
+    `include_keyword_difference=False` the LLM isn't asked for "Keyword difference".
+    """
+    keyword_difference_field = (
+        f"- \"Keyword difference\": An array of important keywords or key phrases that appear in the job application text but are missing or underemphasized in the resume, as well as resume keywords not reflected in the job description.\n"
+        if include_keyword_difference
+        else ""
+    )
+    return (
+        f"You are a seasoned technical recruiter and resume coach specializing in various roles.\n\n"
+        f"Carefully compare the provided **resume content** with the **job application description**, analyzing alignment in skills, experience, and language based on best practices from the Tech Interview Handbook.\n\n"
+        f"Your output should be a JSON object with the following keys:\n\n"
+        f"- \"Grade\": A letter grade (A, B, C, D, or F) assessing how well the resume matches the job application, factoring in relevance of skills, clarity, and demonstrated impact.\n"
+        f"{keyword_difference_field}"
+        f"- \"Skill Gap Analysis\": A detailed explanation of specific technical skills, tools, or experiences requested by the job that are absent or insufficiently demonstrated in the resume.\n"
+        f"- \"Impact & Clarity Gap\": Commentary on missing quantifiable achievements, action verbs, or clear descriptions in the resume relative to expectations set by the job application.\n"
+        f"- \"Recommendations\": Practical advice on how to better tailor the resume to the job, focusing on adding relevant keywords, highlighting measurable impact, and improving clarity or formatting.\n\n"
+        f"**Resume Content:** \n\"{resume_content}\"\n\n"
+        f"**Job Application Text:** \n\"{job_application_text}\"\n\n"
+        f"Return only the JSON object, correctly formatted, without any additional text or explanation outside the JSON."
+    )
+
+
+def prepare_grading(file_content: str, extraction: dict = None):
+    """
+    Returns the /grader prompt and the fields computed locally: the "Preliminary"
+    heuristic grade and, unless GRADER_KEYWORDS_SOURCE is "llm", the "Keywords".
+    The prompt gets the resume fitted to its token budget; "InputTrimmed" reports
+    cuts, along with pages skipped during extraction (`extraction` metadata).
+    """
+    local_fields = {"Preliminary": local_grade(file_content)}
+    if GRADER_KEYWORDS_SOURCE == "local":
+        local_fields["Keywords"] = extract_keywords(file_content)
+    prompt_content, trimmed = fit_resume_to_budget(file_content)
+    trimmed = {**(extraction or {}), **(trimmed or {})}
+    if trimmed:
+        local_fields["InputTrimmed"] = {"Resume": trimmed}
+    prompt = build_grader_prompt(prompt_content, include_keywords="Keywords" not in local_fields)
+    return prompt, local_fields
+
+
+def prepare_comparison(resume_content: str, job_application_text: str, extraction: dict = None):
+    """
+    Returns the /comparison prompt and the fields computed locally from the skill
+    vocabulary according to COMPARISON_KEYWORDS_SOURCE. Both texts are fitted to
+    their token budgets for the prompt; "InputTrimmed" reports cuts, along with
+    resume pages skipped during extraction (`extraction` metadata).
+    """
+    return prepare_job_comparison(
+        prepare_resume_comparison(resume_content, extraction), job_application_text
+    )
+
+
+def prepare_resume_comparison(resume_content: str, extraction: dict = None) -> tuple:
+    """
+    The job-independent half of prepare_comparison: the resume's prompt text, its
+    trim report and its skills (None unless COMPARISON_KEYWORDS_SOURCE needs them).
+    /comparison/bulk computes it once for all postings.
+    """
+    prompt_resume, resume_trimmed = fit_resume_to_budget(resume_content)
+    resume_trimmed = {**(extraction or {}), **(resume_trimmed or {})}
+    resume_skills = None
+    if COMPARISON_KEYWORDS_SOURCE in ("local", "both"):
+        resume_skills = set(skill_vocabulary.find(resume_content))
+    return prompt_resume, resume_trimmed, resume_skills
+
+
+def prepare_job_comparison(prepared_resume: tuple, job_application_text: str):
+    """Builds the comparison prompt and local fields for a prepare_resume_comparison result."""
+    prompt_resume, resume_trimmed, resume_skills = prepared_resume
+    local_fields = {}
+    if resume_skills is not None:
+        gap = skill_vocabulary.gap_from_skills(resume_skills, job_application_text)
+        if COMPARISON_KEYWORDS_SOURCE == "local":
+            local_fields["Keyword difference"] = (
+                gap["MissingFromResume"] + gap["NotInJobDescription"]
+            )
+        local_fields["KeywordGap"] = gap
+    prompt_job, job_trimmed = fit_job_to_budget(job_application_text)
+    trimmed = {"Resume": resume_trimmed, "JobDescription": job_trimmed}
+    if resume_trimmed or job_trimmed:
+        local_fields["InputTrimmed"] = {key: value for key, value in trimmed.items() if value}
+    prompt = build_comparison_prompt(
+        prompt_resume,
+        prompt_job,
+        include_keyword_difference="Keyword difference" not in local_fields,
+    )
+    return prompt, local_fields
+
+
+grader_llm_skips = Counter()
+
+
+def grade_without_llm(file_content: str, local_fields: dict):
+    """
+    Returns a deterministic /grader result, in the LLM's format, for uploads that
+    don't need the LLM: too little text to grade (GRADER_MIN_WORDS), or a local
+    A/F grade at or above LLM_SKIP_CONFIDENCE. Returns None otherwise.
+    """
+    preliminary = local_fields["Preliminary"]
+    if preliminary["WordCount"] < GRADER_MIN_WORDS:
+        grader_llm_skips["degenerate"] += 1
+        note = (
+            "No text could be extracted; the file may be a scanned image."
+            if not file_content.strip()
+            else f"Only {preliminary['WordCount']} words could be extracted."
+        )
+        result = {
+            "SectionFormatting": f"needs work - {note}",
+            "ClarityAction": "needs work - there is not enough text to assess.",
+            "QuantifiableImpact": "needs work - there is not enough text to assess.",
+            "KeywordRelevance": "needs work - there is not enough text to assess.",
+            "BrevityFormatting": "needs work - the resume is nearly empty.",
+            "Grade": "F",
+            "Score": 0,
+            "Highlights": "",
+            "Improvements": (
+                f"{note} Upload a text-based PDF, DOCX, or TXT export of the full resume "
+                f"so it can be graded."
+            ),
+        }
+    elif preliminary["Grade"] in ("A", "F") and preliminary["Confidence"] >= LLM_SKIP_CONFIDENCE:
+        grader_llm_skips["confident"] += 1
+        result = local_grade_result(preliminary)
+    else:
+        return None
+    return merge_local_fields(result, local_fields)
+
+
+def local_grade_result(preliminary: dict) -> dict:
+    """Phrases the local measurements as a /grader result."""
+
+    def verdict(ok: bool, note: str) -> str:
+        return f"{'ok' if ok else 'needs work'} - {note}"
+
+    found = ", ".join(preliminary["Sections"]) or "none"
+    action = preliminary["ActionVerbRatio"]
+    quantified = preliminary["QuantifiedRatio"]
+    pages = preliminary["EstimatedPages"]
+    checks = {
+        "SectionFormatting": verdict(
+            preliminary["SectionsInOrder"] and len(preliminary["Sections"]) >= 3,
+            f"sections found: {found}"
+            + ("" if preliminary["SectionsInOrder"] else "; they are not in the standard order"),
+        ),
+        "ClarityAction": verdict(
+            action >= 0.7, f"{action:.0%} of bullets start with an action verb"
+        ),
+        "QuantifiableImpact": verdict(
+            quantified >= 0.5, f"{quantified:.0%} of bullets include a number or metric"
+        ),
+        "KeywordRelevance": "ok - see Keywords",
+        "BrevityFormatting": verdict(pages <= 1.2, f"about {pages} page(s) of text"),
+    }
+    strong = [key for key, value in checks.items() if value.startswith("ok")]
+    weak = [key for key, value in checks.items() if not value.startswith("ok")]
+    return {
+        **checks,
+        "Grade": preliminary["Grade"],
+        "Score": preliminary["Score"],
+        "Highlights": f"Strong areas: {', '.join(strong)}." if strong else "",
+        "Improvements": f"Areas to improve: {', '.join(weak)}." if weak else "",
+    }
+
+
+def stream_local_json(result: dict) -> StreamingResponse:
+    """Sends a result computed without the LLM in the same SSE format as stream_llm_json."""
+
+    def events():
+        for field, value in result.items():
+            yield sse_event("field", {"key": field, "value": value})
+        yield sse_event("done", result)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
+
+
+def merge_local_fields(result, local_fields: dict):
+    """Puts locally computed fields first in an LLM result, overriding LLM values."""
+    if not isinstance(result, dict):
+        return result
+    merged = dict(local_fields)
+    merged.update((key, value) for key, value in result.items() if key not in local_fields)
+    return merged
+
+
+UNSUPPORTED_FILE_DETAIL = "Unsupported file type. Only PDF, DOCX, and TXT are supported."
+
+
+async def extract_upload_document(file: UploadFile, unsupported_detail: str = UNSUPPORTED_FILE_DETAIL):
+    """
+    Extracts text from an uploaded PDF, DOCX, or text file based on its extension.
+    Returns the text and extraction metadata.
+    """
+    if file.filename.endswith(".pdf"):
+        return await extract_text_from_pdf(file)
+    elif file.filename.endswith(".docx"):
+        return await extract_text_from_docx(file)
+    elif file.filename.endswith(".txt"):
+        return await extract_text_from_text_file(file)
+    raise HTTPException(status_code=400, detail=unsupported_detail)
+
+
+@app.post("/grader")
+async def grade_document(
+    file: UploadFile = File(...),
+    bypass_cache: bool = Header(False, alias="X-Cache-Bypass"),
+    stream: bool = False,
+):
+    """
+    Grades a document (PDF, DOCX, or text) and returns detailed feedback from the LLM.
+    Expected LLM JSON format aligns with the new prompt requirements.
+    With `?stream=true` the result is streamed as Server-Sent Events instead.
+    """
+    file_content, extraction = await extract_upload_document(file)
+    prompt, local_fields = prepare_grading(file_content, extraction)
+    local_result = grade_without_llm(file_content, local_fields)
+    if local_result is not None:
+        return stream_local_json(local_result) if stream else JSONResponse(content=local_result)
+    if stream:
+        return await stream_llm_json(
+            prompt, use_cache=not bypass_cache, local_fields=local_fields
+        )
+    llm_response_str = await call_gemini_llm(prompt, use_cache=not bypass_cache)
+    return JSONResponse(content=merge_local_fields(json.loads(llm_response_str), local_fields))
 
 
 @app.post("/comparison")
 async def compare_resume_to_job_application(
     resume_file: UploadFile = File(..., alias="file"),
     job_application_text: str = File(..., alias="job_application_text"),
+    bypass_cache: bool = Header(False, alias="X-Cache-Bypass"),
+    stream: bool = False,
 ):
     """
     Compares a resume (PDF, DOCX, or text) with a job application text,
     highlighting differences and providing a detailed comparison.
     Expected LLM JSON format aligns with the new prompt requirements.
+    With `?stream=true` the result is streamed as Server-Sent Events instead.
     """
-    resume_content = ""
-    if resume_file.filename.endswith(".pdf"):
-        resume_content = extract_text_from_pdf(resume_file)
-    elif resume_file.filename.endswith(".docx"):
-        resume_content = extract_text_from_docx(resume_file)
-    elif resume_file.filename.endswith(".txt"):
-        resume_content = extract_text_from_text_file(resume_file)
-    else:
+    resume_content, extraction = await extract_upload_document(
+        resume_file,
+        "Unsupported file type for resume. Only PDF, DOCX, and TXT are supported.",
+    )
+    prompt, local_fields = prepare_comparison(resume_content, job_application_text, extraction)
+    if stream:
+        return await stream_llm_json(
+            prompt, use_cache=not bypass_cache, local_fields=local_fields
+        )
+    llm_response_str = await call_gemini_llm(prompt, use_cache=not bypass_cache)
+    return JSONResponse(content=merge_local_fields(json.loads(llm_response_str), local_fields))
+
+
+GRADE_ORDER = {"A": 0, "B": 1, "C": 2, "D": 3, "F": 4}
+
+
+def grade_rank(result) -> int:
+    """Sort key for an LLM result by its letter "Grade" (A first, missing grades last)."""
+    grade = result.get("Grade") if isinstance(result, dict) else None
+    if not isinstance(grade, str) or not grade.strip():
+        return len(GRADE_ORDER)
+    return GRADE_ORDER.get(grade.strip()[0].upper(), len(GRADE_ORDER))
+
+
+@app.post("/comparison/bulk")
+async def compare_resume_to_job_applications(
+    resume_file: UploadFile = File(..., alias="file"),
+    job_application_texts: list[str] = Form(..., alias="job_application_texts"),
+    bypass_cache: bool = Header(False, alias="X-Cache-Bypass"),
+):
+    """
+    Compares one resume against many job descriptions (repeat the
+    `job_application_texts` form field per posting). The resume is extracted once
+    and comparisons run concurrently. Results are streamed as Server-Sent Events:
+    a `result` event per posting as it completes (with "result" or "error"), then
+    a `summary` event ranking the postings by Grade.
+    """
+    if len(job_application_texts) > BULK_COMPARISON_MAX_JOBS:
         raise HTTPException(
             status_code=400,
-            detail="Unsupported file type for resume. Only PDF, DOCX, and TXT are supported.",
+            detail=f"At most {BULK_COMPARISON_MAX_JOBS} job descriptions can be compared at once.",
         )
+    resume_content, extraction = await extract_upload_document(
+        resume_file,
+        "Unsupported file type for resume. Only PDF, DOCX, and TXT are supported.",
+    )
+    # The resume is fitted and scanned for skills once, not once per posting
+    prepared_resume = prepare_resume_comparison(resume_content, extraction)
+    semaphore = asyncio.Semaphore(BULK_COMPARISON_CONCURRENCY)
 
-    prompt = (
-        f"You are a seasoned technical recruiter and resume coach specializing in various roles.\n\n"
-        f"Carefully compare the provided **resume content** with the **job application description**, analyzing alignment in skills, experience, and language based on best practices from the Tech Interview Handbook.\n\n"
-        f"Your output should be a JSON object with the following keys:\n\n"
-        f"- \"Grade\": A letter grade (A, B, C, D, or F) assessing how well the resume matches the job application, factoring in relevance of skills, clarity, and demonstrated impact.\n"
-        f"- \"Keyword difference\": An array of important keywords or key phrases that appear in the job application text but are missing or underemphasized in the resume, as well as resume keywords not reflected in the job description.\n"
-        f"- \"Skill Gap Analysis\": A detailed explanation of specific technical skills, tools, or experiences requested by the job that are absent or insufficiently demonstrated in the resume.\n"
-        f"- \"Impact & Clarity Gap\": Commentary on missing quantifiable achievements, action verbs, or clear descriptions in the resume relative to expectations set by the job application.\n"
-        f"- \"Recommendations\": Practical advice on how to better tailor the resume to the job, focusing on adding relevant keywords, highlighting measurable impact, and improving clarity or formatting.\n\n"
-        f"**Resume Content:** \n\"{resume_content}\"\n\n"
-        f"**Job Application Text:** \n\"{job_application_text}\"\n\n"
-        f"Return only the JSON object, correctly formatted, without any additional text or explanation outside the JSON."
+    async def compare(index: int) -> dict:
+        async with semaphore:
+            # Prompts are built inside the semaphore so at most
+            # BULK_COMPARISON_CONCURRENCY prompts exist at once
+            prompt, local_fields = prepare_job_comparison(
+                prepared_resume, job_application_texts[index]
+            )
+            try:
+                llm_response_str = await call_gemini_llm(
+                    prompt, use_cache=not bypass_cache, priority=PRIORITY_BULK
+                )
+                result = merge_local_fields(json.loads(llm_response_str), local_fields)
+                return {"index": index, "result": result}
+            except HTTPException as e:
+                return {"index": index, "error": e.detail}
+            except ValueError:
+                return {"index": index, "error": "Gemini LLM returned malformed JSON."}
+
+    async def events():
+        tasks = [asyncio.create_task(compare(index)) for index in range(len(job_application_texts))]
+        completed = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                completed.append(item)
+                yield sse_event("result", item)
+        finally:
+            for task in tasks:
+                task.cancel()
+        ranking = sorted(
+            completed, key=lambda item: (grade_rank(item.get("result")), item["index"])
+        )
+        yield sse_event(
+            "summary",
+            {
+                "ranking": [
+                    {"index": item["index"], "Grade": item["result"].get("Grade")}
+                    for item in ranking
+                    if "result" in item
+                ],
+                "failed": [item["index"] for item in ranking if "error" in item],
+            },
+        )
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
     )
-    llm_response_str = await call_gemini_llm(prompt)
-    return JSONResponse(content=json.loads(llm_response_str))
+
+
+def prerank_resumes(job_application_text: str, resume_texts: list) -> list:
+    """
+    Scores each resume by how much of the job description's vocabulary it covers,
+    weighting terms by their IDF across the submitted resumes. Returns scores in
+    the range 0–1 in input order.
+    """
+    job_terms = Counter(tokenize(job_application_text))
+    resume_terms = [set(tokenize(text)) for text in resume_texts]
+    document_frequency = Counter(
+        term for terms in resume_terms for term in terms & job_terms.keys()
+    )
+    total = len(resume_terms)
+    weights = {
+        term: count * math.log((total + 1) / (document_frequency[term] + 0.5))
+        for term, count in job_terms.items()
+    }
+    denominator = sum(weights.values()) or 1.0
+    return [
+        sum(weight for term, weight in weights.items() if term in terms) / denominator
+        for terms in resume_terms
+    ]
+
+
+def open_zip_member(archive: zipfile.ZipFile, member: zipfile.ZipInfo) -> UploadFile:
+    """
+    Decompresses one archive member into a spooled temp file, which moves to disk
+    past UPLOAD_SPOOL_THRESHOLD_BYTES.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD_BYTES)
+    try:
+        with archive.open(member) as source:
+            for chunk in iter(lambda: source.read(UploadSource.CHUNK_BYTES), b""):
+                spool.write(chunk)
+    except zipfile.BadZipFile as e:
+        spool.close()
+        raise HTTPException(status_code=400, detail=f"Error processing ZIP: {e}")
+    spool.seek(0)
+    return UploadFile(spool, filename=os.path.basename(member.filename))
+
+
+def score_resumes(job_application_text: str, resume_texts: list) -> list:
+    """Returns a (prerank score, keyword gap) pair for each resume, in input order."""
+    scores = prerank_resumes(job_application_text, resume_texts)
+    return [
+        (score, skill_vocabulary.gap(text, job_application_text))
+        for score, text in zip(scores, resume_texts)
+    ]
+
+
+def expand_resume_uploads(files: list) -> list:
+    """
+    Returns (filename, open_upload) pairs for the resumes to rank, unpacking .zip
+    archives into their PDF, DOCX and TXT members. `open_upload` returns the
+    UploadFile; archive members are only decompressed when it is called.
+    """
+    uploads = []
+    total_bytes = 0
+    for file in files:
+        if not file.filename.endswith(".zip"):
+            uploads.append((file.filename, lambda file=file: file))
+            continue
+        try:
+            archive = zipfile.ZipFile(file.file)
+            members = archive.infolist()
+        except zipfile.BadZipFile as e:
+            raise HTTPException(status_code=400, detail=f"Error processing ZIP: {e}")
+        for member in members:
+            name = member.filename
+            if member.is_dir() or not name.endswith((".pdf", ".docx", ".txt")):
+                continue
+            # zipfile never reads past the declared size, so these checks hold
+            if member.file_size > RANKING_MAX_FILE_BYTES:
+                raise HTTPException(status_code=400, detail=f"{name} is too large.")
+            total_bytes += member.file_size
+            if total_bytes > RANKING_MAX_TOTAL_BYTES:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"The archives expand to more than {RANKING_MAX_TOTAL_BYTES} bytes.",
+                )
+            uploads.append(
+                (
+                    os.path.basename(name),
+                    lambda archive=archive, member=member: open_zip_member(archive, member),
+                )
+            )
+            if len(uploads) > RANKING_MAX_RESUMES:
+                break
+    if len(uploads) > RANKING_MAX_RESUMES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {RANKING_MAX_RESUMES} resumes can be ranked at once.",
+        )
+    return uploads
+
+
+@app.post("/ranking")
+async def rank_resumes(
+    files: list[UploadFile] = File(...),
+    job_application_text: str = Form(...),
+    top_k: int = RANKING_TOP_K,
+    bypass_cache: bool = Header(False, alias="X-Cache-Bypass"),
+):
+    """
+    Ranks many resumes (PDF/DOCX/TXT files or .zip archives of them) against one
+    job description. All resumes are extracted in parallel and pre-ranked locally
+    by keyword coverage; only the best `top_k` are compared by the LLM. Returns a
+    leaderboard: LLM-compared resumes ordered by Grade, then the rest by score.
+    Entries for PDFs cut short at PDF_EXTRACTION_TOKEN_BUDGET carry "pages_skipped".
+    """
+    uploads = expand_resume_uploads(files)
+    extraction_slots = asyncio.Semaphore(EXTRACTION_POOL_SIZE)
+
+    async def extract(open_upload):
+        async with extraction_slots:
+            try:
+                upload = await asyncio.to_thread(open_upload)
+            except HTTPException as e:
+                return e
+            try:
+                return await extract_upload_document(upload)
+            except HTTPException as e:
+                return e
+            finally:
+                await upload.close()
+
+    documents = await asyncio.gather(*(extract(open_upload) for _, open_upload in uploads))
+    entries = [{"filename": filename} for filename, _ in uploads]
+    texts = {}
+    extractions = {}
+    for index, document in enumerate(documents):
+        if isinstance(document, HTTPException):
+            entries[index]["error"] = document.detail
+            continue
+        texts[index], extractions[index] = document
+        if extractions[index].get("PagesSkipped"):
+            entries[index]["pages_skipped"] = extractions[index]["PagesSkipped"]
+    readable = list(texts)
+    # Hundreds of resumes take a noticeable time to score, so it runs off the event loop
+    scored = await asyncio.to_thread(
+        score_resumes, job_application_text, [texts[index] for index in readable]
+    )
+    for index, (score, gap) in zip(readable, scored):
+        entries[index]["prerank_score"] = round(score, 4)
+        entries[index]["keyword_gap"] = gap
+    shortlist = sorted(readable, key=lambda index: -entries[index]["prerank_score"])
+    shortlist = shortlist[: max(0, min(top_k, len(shortlist)))]
+    semaphore = asyncio.Semaphore(BULK_COMPARISON_CONCURRENCY)
+
+    async def compare(index: int):
+        async with semaphore:
+            prompt, local_fields = prepare_comparison(
+                texts[index], job_application_text, extractions[index]
+            )
+            try:
+                llm_response_str = await call_gemini_llm(
+                    prompt, use_cache=not bypass_cache, priority=PRIORITY_BULK
+                )
+                entries[index]["result"] = merge_local_fields(
+                    json.loads(llm_response_str), local_fields
+                )
+            except HTTPException as e:
+                entries[index]["error"] = e.detail
+            except ValueError:
+                entries[index]["error"] = "Gemini LLM returned malformed JSON."
+
+    await asyncio.gather(*(compare(index) for index in shortlist))
+    leaderboard = sorted(
+        entries,
+        key=lambda entry: (
+            "result" not in entry,
+            grade_rank(entry.get("result")),
+            -entry.get("prerank_score", -1),
+        ),
+    )
+    return JSONResponse(content={"leaderboard": leaderboard, "llm_compared": len(shortlist)})
+
+
+class JobRunner:
+    """
+    Runs submitted coroutines on a fixed pool of background workers. Each job is
+    tracked by id; finished jobs are forgotten after `result_ttl_seconds`.
+    """
+
+    def __init__(self, workers: int, max_queued: int, result_ttl_seconds: float):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl_seconds = result_ttl_seconds
+        self._jobs = {}
+        self._queue = None
+        self._tasks = []
+
+    def submit(self, work) -> dict:
+        """Queues `work` (a zero-argument coroutine function) and returns its job record."""
+        self._prune()
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self._queue.qsize() >= self.max_queued:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many jobs are queued. Please retry shortly.",
+                headers={"Retry-After": str(LLM_RETRY_AFTER_SECONDS)},
+            )
+        job = {"job_id": uuid.uuid4().hex, "status": "queued", "created_at": time.time()}
+        self._jobs[job["job_id"]] = job
+        self._queue.put_nowait((job, work))
+        return job
+
+    def complete(self, result) -> dict:
+        """Records an already computed `result` as a succeeded job, skipping the queue."""
+        self._prune()
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "succeeded",
+            "created_at": now,
+            "result": result,
+            "finished_at": now,
+        }
+        self._jobs[job["job_id"]] = job
+        return job
+
+    def get(self, job_id: str):
+        self._prune()
+        return self._jobs.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job, work = await self._queue.get()
+            job["status"] = "running"
+            try:
+                job["result"] = await work()
+                job["status"] = "succeeded"
+            except HTTPException as e:
+                job["status"] = "failed"
+                job["error"] = e.detail
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = f"Error processing job: {e}"
+            job["finished_at"] = time.time()
+            self._queue.task_done()
+
+    def _prune(self):
+        cutoff = time.time() - self.result_ttl_seconds
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.get("finished_at", cutoff + 1) < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def stats(self) -> dict:
+        statuses = {}
+        for job in self._jobs.values():
+            statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+        return {"workers": len(self._tasks), "jobs": statuses}
+
+
+job_runner = JobRunner(JOB_WORKERS, JOB_MAX_QUEUED, JOB_RESULT_TTL_SECONDS)
+
+
+async def run_llm_json(prompt: str, use_cache: bool = True, local_fields: dict = None):
+    """Calls the LLM, parses its JSON response and merges in any local fields."""
+    result = json.loads(await call_gemini_llm(prompt, use_cache=use_cache))
+    return merge_local_fields(result, local_fields or {})
+
+
+@app.post("/jobs/grader", status_code=202)
+async def submit_grader_job(
+    file: UploadFile = File(...),
+    bypass_cache: bool = Header(False, alias="X-Cache-Bypass"),
+):
+    """
+    Queues a /grader request and returns its job id immediately.
+    Poll GET /jobs/{job_id} for the result.
+    """
+    file_content, extraction = await extract_upload_document(file)
+    prompt, local_fields = prepare_grading(file_content, extraction)
+    local_result = grade_without_llm(file_content, local_fields)
+    if local_result is not None:
+        job = job_runner.complete(local_result)
+    else:
+        job = job_runner.submit(
+            lambda: run_llm_json(prompt, use_cache=not bypass_cache, local_fields=local_fields)
+        )
+    # The heuristic grade is available right away, before the LLM result
+    job["preliminary"] = local_fields["Preliminary"]
+    return {"job_id": job["job_id"], "status": job["status"], "preliminary": job["preliminary"]}
+
+
+@app.post("/jobs/comparison", status_code=202)
+async def submit_comparison_job(
+    resume_file: UploadFile = File(..., alias="file"),
+    job_application_text: str = File(..., alias="job_application_text"),
+    bypass_cache: bool = Header(False, alias="X-Cache-Bypass"),
+):
+    """
+    Queues a /comparison request and returns its job id immediately.
+    Poll GET /jobs/{job_id} for the result.
+    """
+    resume_content, extraction = await extract_upload_document(
+        resume_file,
+        "Unsupported file type for resume. Only PDF, DOCX, and TXT are supported.",
+    )
+    prompt, local_fields = prepare_comparison(resume_content, job_application_text, extraction)
+    job = job_runner.submit(
+        lambda: run_llm_json(prompt, use_cache=not bypass_cache, local_fields=local_fields)
+    )
+    return {"job_id": job["job_id"], "status": job["status"]}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Returns a job's status ("queued", "running", "succeeded" or "failed"),
+    with its "result" or "error" once finished.
+    """
+    job = job_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return job
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Returns internal counters for caches and upstream calls."""
+    return {
+        "extraction_cache": extraction_cache.stats(),
+        "llm_cache": response_cache.stats(),
+        "llm_single_flight": gemini_flights.stats(),
+        "llm_admission": llm_admission.stats(),
+        "gemini_quota": gemini_quota.stats(),
+        "llm_retries": gemini_retries.stats(),
+        "llm_hedging": gemini_hedger.stats(),
+        "jobs": job_runner.stats(),
+        "grader_llm_skips": dict(grader_llm_skips),
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+"""
+Gemini calls against an in-process fake backend that always answers UNAVAILABLE:
+the error has to come back as a 503 within LLM_DEADLINE_SECONDS, retried only by
+RetryPolicy.
+"""
+
+import os
+import time
+import asyncio
+import tempfile
+
+import grpc
+import pytest
+from google.ai import generativelanguage as glm
+from google.auth.credentials import AnonymousCredentials
+
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+import main
+
+SERVICE = "google.ai.generativelanguage.v1beta.GenerativeService"
+DEADLINE_SECONDS = 3
+
+
+async def start_unavailable_backend(address: str, attempts: list):
+    async def generate_content(request, context):
+        attempts.append(time.monotonic())
+        await context.abort(grpc.StatusCode.UNAVAILABLE, "overloaded")
+
+    handler = grpc.method_handlers_generic_handler(
+        SERVICE,
+        {
+            "GenerateContent": grpc.unary_unary_rpc_method_handler(
+                generate_content,
+                request_deserializer=glm.GenerateContentRequest.deserialize,
+                response_serializer=glm.GenerateContentResponse.serialize,
+            ),
+            "StreamGenerateContent": grpc.unary_stream_rpc_method_handler(
+                generate_content,
+                request_deserializer=glm.GenerateContentRequest.deserialize,
+                response_serializer=glm.GenerateContentResponse.serialize,
+            ),
+        },
+    )
+    server = grpc.aio.server()
+    server.add_generic_rpc_handlers((handler,))
+    server.add_secure_port(address, grpc.local_server_credentials(grpc.LocalConnectionType.UDS))
+    await server.start()
+    return server
+
+
+def local_client(address: str):
+    """An async client for the fake backend, on the app's own channel settings."""
+    transport_class = glm.GenerativeServiceAsyncClient.get_transport_class("grpc_asyncio")
+    return glm.GenerativeServiceAsyncClient(
+        credentials=AnonymousCredentials(),
+        client_options={"api_endpoint": address},
+        transport=lambda **kwargs: transport_class(
+            channel=main.create_gemini_channel,
+            ssl_channel_credentials=grpc.local_channel_credentials(grpc.LocalConnectionType.UDS),
+            **kwargs,
+        ),
+    )
+
+
+@pytest.fixture
+def unavailable_gemini(monkeypatch):
+    """Points the app's model registry at a backend that always fails; yields its attempt log."""
+    address = f"unix:{tempfile.mkdtemp()}/gemini.sock"
+    attempts = []
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(start_unavailable_backend(address, attempts))
+    models = main.ModelRegistry(lambda: local_client(address))
+    monkeypatch.setattr(main, "gemini_models", models)
+    monkeypatch.setattr(main, "LLM_DEADLINE_SECONDS", DEADLINE_SECONDS)
+    monkeypatch.setattr(main, "gemini_retries", main.RetryPolicy(100, 0.2, 0.5))
+    yield loop, attempts
+    loop.run_until_complete(models.close())
+    loop.run_until_complete(server.stop(None))
+    loop.close()
+
+
+def test_unavailable_returns_503_within_deadline(unavailable_gemini):
+    loop, attempts = unavailable_gemini
+    start = time.monotonic()
+    with pytest.raises(main.HTTPException) as error:
+        loop.run_until_complete(
+            asyncio.wait_for(
+                main.call_gemini_llm("deadline test prompt", use_cache=False),
+                timeout=DEADLINE_SECONDS * 5,
+            )
+        )
+    elapsed = time.monotonic() - start
+    assert error.value.status_code in (503, 504)
+    assert elapsed < DEADLINE_SECONDS + 1
+    # Every upstream attempt was made (and seen) by RetryPolicy, none by the client library
+    stats = main.gemini_retries.stats()
+    assert stats["exhausted"] == 1
+    assert len(attempts) == stats["retries"] + 1
+
+
+def test_unavailable_stream_fails_without_client_retries(unavailable_gemini):
+    loop, attempts = unavailable_gemini
+
+    async def consume():
+        return [text async for text in main.stream_gemini("stream deadline test prompt")]
+
+    start = time.monotonic()
+    with pytest.raises(main.HTTPException) as error:
+        loop.run_until_complete(asyncio.wait_for(consume(), timeout=DEADLINE_SECONDS * 5))
+    assert error.value.status_code == 503
+    assert time.monotonic() - start < DEADLINE_SECONDS
+    assert len(attempts) == 1
@@ -0,0 +1,35 @@
+"""Clean-up of extracted text by normalize_text."""
+
+import os
+
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+import main
+
+
+def test_broken_words_are_dehyphenated():
+    text = main.normalize_text("Ran Kuber-\nnetes and Post-\ngreSQL; automated deploy-\nment")
+    assert text == "Ran Kubernetes and PostgreSQL; automated deployment"
+    assert main.skill_vocabulary.find(text) == ["Kubernetes", "PostgreSQL"]
+
+
+def test_words_written_unbroken_elsewhere_are_dehyphenated():
+    assert main.normalize_text("Mentored engi-\nneers; hired engineers") == (
+        "Mentored engineers; hired engineers"
+    )
+
+
+def test_real_compounds_keep_their_hyphen():
+    text = main.normalize_text(
+        "Built end-to-\nend e-\ncommerce checkout, a well-\nknown full-\nstack real-\ntime app"
+    )
+    assert text == "Built end-to-end e-commerce checkout, a well-known full-stack real-time app"
+
+
+def test_indented_continuation_is_dehyphenated():
+    assert main.normalize_text("Scaled Kuber- \n   netes") == "Scaled Kubernetes"
+
+
+def test_list_items_are_not_joined_after_a_comma():
+    text = main.normalize_text("Skills: Python, Java,\n Led team of 5")
+    assert text == "Skills: Python, Java,\n• Led team of 5"
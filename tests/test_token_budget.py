@@ -0,0 +1,76 @@
+"""Fitting resume and job description text to the prompt token budgets."""
+
+import os
+
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+import main
+
+WORDS = "designed distributed services reducing latency for customers across regions".split()
+
+
+def prose(characters: int) -> str:
+    """One line of words, about `characters` long."""
+    words = []
+    size = 0
+    while size < characters:
+        word = WORDS[len(words) % len(WORDS)]
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)
+
+
+def test_cut_at_word_ends_on_a_whole_word():
+    assert main.cut_at_word("alpha beta gamma", 12) == "alpha beta"
+    assert main.cut_at_word("alpha beta gamma", 10) == "alpha beta"
+    assert main.cut_at_word("alpha beta gamma", 100) == "alpha beta gamma"
+    assert main.cut_at_word("alphabet", 5) == "alpha"
+    assert main.cut_at_word("alpha", 0) == ""
+
+
+def test_single_line_resume_is_cut_inside_the_line():
+    resume = prose(22000)
+    text, report = main.fit_resume_to_budget(resume)
+    assert text.endswith("\n[...]")
+    kept = text[: -len("\n[...]")]
+    assert resume.startswith(kept)
+    assert kept.split()[-1] == resume[: len(kept) + 1].split()[-1]
+    assert main.PROMPT_RESUME_TOKEN_BUDGET * 0.95 <= report["PromptTokens"]
+    assert report["PromptTokens"] <= main.PROMPT_RESUME_TOKEN_BUDGET
+    assert report["SectionsCut"] == ["header"]
+
+
+def test_long_job_paragraph_uses_the_remaining_budget():
+    job = "\n".join(
+        [
+            "About the role",
+            prose(34000),
+            "Requirements",
+            "5+ years of Python and Kubernetes.",
+            "About us",
+            "We build developer tools.",
+        ]
+    )
+    text, report = main.fit_job_to_budget(job)
+    # The requirements and the short company blurb fit whole; the role
+    # description fills the rest of the budget instead of being dropped
+    assert "5+ years of Python and Kubernetes." in text
+    assert "We build developer tools." in text
+    assert text.startswith("About the role\n" + WORDS[0])
+    assert report["SectionsCut"] == ["responsibilities"]
+    assert main.PROMPT_JOB_TOKEN_BUDGET * 0.95 <= report["PromptTokens"]
+    assert report["PromptTokens"] <= main.PROMPT_JOB_TOKEN_BUDGET
+
+
+def test_whole_lines_are_kept_while_they_fit():
+    lines = [prose(200) for _ in range(200)]
+    text, report = main.fit_resume_to_budget("\n".join(lines))
+    kept = text.split("\n")[:-1]
+    assert kept[:-1] == lines[: len(kept) - 1]
+    assert lines[len(kept) - 1].startswith(kept[-1])
+    assert report["PromptTokens"] <= main.PROMPT_RESUME_TOKEN_BUDGET
+
+
+def test_text_within_budget_is_untouched():
+    resume = "Experience\n" + prose(400)
+    assert main.fit_resume_to_budget(resume) == (resume, None)